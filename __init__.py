@@ -1,14 +1,18 @@
 import bpy
 
 from bpy.types import PropertyGroup, StringProperty, PointerProperty, CollectionProperty, BoolProperty, EnumProperty, FloatProperty
-from bpy.types import Operator
+from bpy.types import Operator, AddonPreferences
 from bpy.props import *
 
-import imp, sys, os
-for filename in [ f for f in os.listdir(os.path.dirname(os.path.realpath(__file__))) if f.endswith(".py") ]:
-    if filename == os.path.basename(__file__): continue
-    mod = sys.modules.get("{}.{}".format(__name__,filename[:-3]))
-    if mod: imp.reload(mod)
+import importlib, sys, os, re, tempfile
+
+# Reload the submodules that were already imported when the add-on is
+# reloaded, only while developing (blender --debug, or QCGEN_DEV is set).
+# Everything but vmt_generator is imported on first use, by the operators.
+if bpy.app.debug or os.environ.get("QCGEN_DEV"):
+    for name, mod in list(sys.modules.items()):
+        if mod and name.startswith(__name__ + "."):
+            importlib.reload(mod)
 
 bl_info = {
     "name": "QC Generator",
@@ -51,6 +55,20 @@ class QC_Body(PropertyGroup):
     )
     
 
+class QC_Model(PropertyGroup):
+    collection: PointerProperty(
+        name="Collection",
+        description="Collection with the export items of this model",
+        type=bpy.types.Collection
+    )
+    modelname: StringProperty(
+        name="MDL File Path",
+        description="The model's $modelname, <MDL folder>/<collection name>.mdl if empty")
+    cdmaterials: StringProperty(
+        name="CD Materials",
+        description="The model's $cdmaterials, the scene's if empty")
+
+
 class QC_Properties(PropertyGroup):
     qc_text : PointerProperty(
         name="QC Text Output",
@@ -67,6 +85,17 @@ class QC_Properties(PropertyGroup):
         options={'HIDDEN'},
         default=True
     )
+    preflight: BoolProperty(
+        name="Pre-flight Checks",
+        description="Check the bodies and the collision model against studiomdl's limits when writing the QC",
+        options={'HIDDEN'},
+        default=True
+    )
+    qc_fingerprint: StringProperty(
+        name="Input Fingerprint",
+        description="Hash of the inputs and of the text of the last generated QC",
+        options={'HIDDEN'}
+    )
     
     collisionmodel : PointerProperty(
         name="Collision Model",
@@ -87,6 +116,49 @@ class QC_Properties(PropertyGroup):
         options={'HIDDEN'},
         default=True
     )
+    bone_filter: EnumProperty(
+        name="Bones",
+        description="Which bones get an attachment and a bone follower",
+        items=(
+            ('ALL', "All", "Every bone of the armature"),
+            ('DEFORM', "Deform", "Only bones that deform the mesh"),
+            ('COLLECTION', "Collection", "Only bones in a bone collection (bone group before Blender 4.0)"),
+        ),
+        options={'HIDDEN'},
+        default='ALL'
+    )
+    bone_collection: StringProperty(
+        name="Bone Collection",
+        options={'HIDDEN'}
+    )
+    bone_include: StringProperty(
+        name="Include",
+        description="Only bones whose name matches this regular expression",
+        options={'HIDDEN'}
+    )
+    bone_exclude: StringProperty(
+        name="Exclude",
+        description="Skip bones whose name matches this regular expression",
+        options={'HIDDEN'}
+    )
+    lod_distance: FloatProperty(
+        name="LOD Distance",
+        description="Distance at which lod1 replaces the reference, lodN is used from N times this distance",
+        options={'HIDDEN'},
+        default=25.0, min=0.0
+    )
+    lod_count: IntProperty(
+        name="LOD Count",
+        description="How many LODs Create Missing LODs makes",
+        options={'HIDDEN'},
+        default=2, min=1, max=8
+    )
+    lod_ratio: FloatProperty(
+        name="Decimate Ratio",
+        description="Share of the faces each LOD keeps from the one before it, lodN keeps ratio^N of the reference",
+        options={'HIDDEN'},
+        default=0.5, min=0.01, max=1.0
+    )
     modelname: StringProperty(
         name="MDL File Path", description="The path of the .mdl file relative to the models/ dir.")
     cdmaterials: StringProperty(
@@ -94,6 +166,16 @@ class QC_Properties(PropertyGroup):
         default="models/")
     bodies: CollectionProperty(
         name="Bodies", type=QC_Body)
+    multi_qc: BoolProperty(
+        name="One QC per Model",
+        description="Write a QC for each model in the list, or for each top-level collection if the list is empty",
+        options={'HIDDEN'},
+        default=False
+    )
+    models: CollectionProperty(
+        name="Models", type=QC_Model, options={'HIDDEN'})
+    models_active: IntProperty(
+        name="Selected Model", default=0, min=0, options={'HIDDEN'})
     bodies_active: IntProperty(
         name="Selected Body", default=0, min=0, options={'HIDDEN'})  # , update=bodies_active_changed)
     staticprop: BoolProperty(
@@ -119,6 +201,65 @@ class QC_Properties(PropertyGroup):
 
     
 
+class QC_Preferences(AddonPreferences):
+    bl_idname = __name__
+
+    profile: BoolProperty(
+        name="Profile Operators",
+        description="Time the phases of Write QC and the VMT/VTF operators, report the slowest ones and write a Chrome trace",
+        default=False
+    )
+    profile_dir: StringProperty(
+        name="Trace Folder",
+        description="Where the traces are written, the system's temp folder if empty",
+        subtype='DIR_PATH'
+    )
+    studiomdl_path: StringProperty(
+        name="studiomdl",
+        description="studiomdl executable to compile QCs with, studiomdl.exe in the Engine Path if empty",
+        subtype='FILE_PATH'
+    )
+    studiomdl_jobs: IntProperty(
+        name="Concurrent Compiles",
+        description="How many studiomdl processes to run at once, 0 for one per CPU core",
+        default=0, min=0
+    )
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(self, 'studiomdl_path')
+        layout.prop(self, 'studiomdl_jobs')
+        layout.prop(self, 'profile')
+        row = layout.row()
+        row.enabled = self.profile
+        row.prop(self, 'profile_dir')
+
+def get_preferences(context):
+    addon = context.preferences.addons.get(__name__)
+    return addon.preferences if addon else None
+
+def get_profiler(context, name):
+    """A Profiler if profiling is enabled in the preferences, otherwise a no-op one"""
+    from .profiling import Profiler, NULL_PROFILER
+    prefs = get_preferences(context)
+    if prefs is None or not prefs.profile:
+        return NULL_PROFILER
+    return Profiler(name)
+
+def report_profile(context, profiler, op):
+    """Writes <name>.trace.json and reports the slowest phases"""
+    if not profiler.enabled:
+        return
+    prefs = get_preferences(context)
+    trace_dir = bpy.path.abspath(prefs.profile_dir) if prefs.profile_dir else tempfile.gettempdir()
+    trace_path = os.path.join(trace_dir, profiler.name + ".trace.json")
+    try:
+        profiler.write(trace_path)
+    except OSError as e:
+        op.report({'WARNING'}, "Couldn't write the trace: {}".format(e))
+        trace_path = None
+    op.report({'INFO'}, profiler.summary() + (" (trace: {})".format(trace_path) if trace_path else ""))
+
 #endregion
 
 #region Body List + Operators
@@ -209,6 +350,41 @@ class QC_OT_MoveBody(Operator):
         self.move_index()
 
         return{'FINISHED'} 
+
+class QC_UL_ModelList(bpy.types.UIList):
+    def draw_item(self, context, layout, data, item, icon, active_data, active_propname, index):
+        if self.layout_type in {'DEFAULT', 'COMPACT'}:
+            row = layout.row()
+            row.prop(item, 'collection', text="", emboss=False)
+            row.prop(item, 'modelname', text="", emboss=False)
+        elif self.layout_type in {'GRID'}:
+            layout.alignment = 'CENTER'
+            layout.label(text="", icon='OUTLINER_COLLECTION')
+
+class QC_OT_AddModel(Operator):
+    bl_idname = "qcgen.models_add"
+    bl_label = "Add a model"
+
+    def execute(self, context):
+        qcgen = context.scene.qcgen
+        qcgen.models.add()
+        qcgen.models_active = len(qcgen.models) - 1
+        return{'FINISHED'}
+
+class QC_OT_RemoveModel(Operator):
+    bl_idname = "qcgen.models_remove"
+    bl_label = "Remove a model"
+
+    @classmethod
+    def poll(cls, context):
+        return context.scene.qcgen.models
+
+    def execute(self, context):
+        qcgen = context.scene.qcgen
+        index = qcgen.models_active
+        qcgen.models.remove(index)
+        qcgen.models_active = min(max(0, index - 1), len(qcgen.models) - 1)
+        return{'FINISHED'}
 # endregion
 
 # based on biggest_non_image_area
@@ -241,10 +417,13 @@ class QC_OT_WriteQC(Operator):
     bl_label = "Write QC File"
 
     def execute(self, context):
-        from .qcfile import write_qc_file, qc_from_vs
+        from .qcfile import write_qc_file, qc_from_vs, qc_fingerprint, qc_digest, ExportIndex, ActionCache
         qcgen = context.scene.qcgen
         qcgen.last_info_msg = ""
-        qctxt = qc_from_vs(context)
+        profiler = get_profiler(context, "qcgen_write")
+
+        if qcgen.multi_qc:
+            return self.write_models(context, profiler)
 
         if not qcgen.qc_text:
             i = len(bpy.data.texts)
@@ -252,8 +431,35 @@ class QC_OT_WriteQC(Operator):
             qcgen.qc_text = bpy.data.texts[i]
             qcgen.qc_text.name = os.path.splitext(os.path.basename(bpy.data.filepath))[0] + ".qc"
         qc_text = qcgen.qc_text
-        qc_text.clear()
-        qc_text.write(qctxt)
+
+        qc_path = bpy.path.abspath(qc_text.filepath) if qc_text.filepath else default_qc_path()
+        old_text = qc_text.as_string()
+        with profiler.span("read file"):
+            old_file = read_text_file(qc_path) if qcgen.save_qc_file else old_text
+
+        # only regenerate if the inputs changed or the QC was edited since, in
+        # the text block or in the file: the stored fingerprint ends with a hash of the generated text
+        with profiler.span("fingerprint"):
+            index = ExportIndex(context.scene.vs.export_list)
+            actions = ActionCache()
+            fingerprint = qc_fingerprint(context, index, actions)
+        if qcgen.qc_fingerprint == fingerprint + " " + qc_digest(old_text) and old_file == old_text:
+            qctxt = old_text
+        else:
+            try:
+                with profiler.span("generate"):
+                    qctxt = qc_from_vs(context, index=index, actions=actions, profiler=profiler)
+            except re.error as e:
+                self.report({'ERROR'}, "Invalid bone filter: {}".format(e))
+                return{'CANCELLED'}
+            qcgen.qc_fingerprint = fingerprint + " " + qc_digest(qctxt)
+
+        # don't touch the text block or the file if nothing changed,
+        # so their modification times only move when the QC does
+        if qctxt != old_text:
+            with profiler.span("text block"):
+                qc_text.clear()
+                qc_text.write(qctxt)
         
         text_editor_area = None
 
@@ -290,19 +496,205 @@ class QC_OT_WriteQC(Operator):
         # from this context. we can write the file but it will
         # cause the file to be marked conflicted (even though it's not)
         if qcgen.save_qc_file:
-            if qc_text.filepath:
-                qc_path = qc_text.filepath
-            else:
-                qc_path = os.path.splitext(os.path.basename(bpy.data.filepath))[0] + ".qc"
-                qc_path = os.path.join(os.path.dirname(bpy.data.filepath), qc_path)
+            if not qc_text.filepath:
                 qc_text.filepath = qc_path
-            with open(qc_path, 'w', encoding='utf8') as f:
-                f.write(qc_text.as_string())
-            
-            self.report({'INFO'}, "Saved file " + os.path.basename(qc_path))
-        
+            if qctxt == old_file:
+                self.report({'INFO'}, os.path.basename(qc_path) + " is unchanged")
+            else:
+                with profiler.span("write file"):
+                    with open(qc_path, 'w', encoding='utf8') as f:
+                        f.write(qctxt)
+                self.report({'INFO'}, "Saved file " + os.path.basename(qc_path))
+        elif qctxt == old_text:
+            self.report({'INFO'}, "QC is unchanged")
+
+        if qcgen.preflight:
+            with profiler.span("preflight"):
+                self.run_preflight(context, qcgen, context.scene.vs.export_list, index)
+
+        report_profile(context, profiler, self)
+        return{'FINISHED'}
+
+    def run_preflight(self, context, props, export_items, index):
+        from .preflight import preflight
+        report = preflight(context, props, export_items, index)
+        self.report({'INFO'}, report.summary())
+        for problem in report.problems:
+            self.report({'WARNING'}, problem)
+
+    def write_models(self, context, profiler):
+        """Writes <collection name>.qc for each model, see qcfile.qc_models()"""
+        from .qcfile import qc_from_vs, qc_models, ExportIndex, ActionCache
+        qcgen = context.scene.qcgen
+
+        # one index and action cache for all the models
+        with profiler.span("models"):
+            index = ExportIndex(context.scene.vs.export_list)
+            actions = ActionCache()
+            models = qc_models(context, index)
+        if not models:
+            self.report({'ERROR'}, "None of the models have export items")
+            return{'CANCELLED'}
+
+        blend_dir = os.path.dirname(bpy.data.filepath)
+        written = 0
+        for name, props, items in models:
+            try:
+                with profiler.span("generate", model=name):
+                    qctxt = qc_from_vs(context, index=index, actions=actions, profiler=profiler,
+                                       props=props, export_items=items)
+            except re.error as e:
+                self.report({'ERROR'}, "Invalid bone filter: {}".format(e))
+                return{'CANCELLED'}
+
+            qc_name = name + ".qc"
+            qc_path = os.path.join(blend_dir, qc_name)
+            with profiler.span("text block", model=name):
+                qc_text = bpy.data.texts.get(qc_name) or bpy.data.texts.new(qc_name)
+                if qc_text.as_string() != qctxt:
+                    qc_text.clear()
+                    qc_text.write(qctxt)
+
+            if qcgen.save_qc_file:
+                if not qc_text.filepath:
+                    qc_text.filepath = qc_path
+                with profiler.span("write file", model=name):
+                    if read_text_file(qc_path) != qctxt:
+                        with open(qc_path, 'w', encoding='utf8') as f:
+                            f.write(qctxt)
+                        written += 1
+
+            if qcgen.preflight:
+                with profiler.span("preflight", model=name):
+                    self.run_preflight(context, props, items, index)
+
+        if qcgen.save_qc_file:
+            self.report({'INFO'}, "Saved {} QC files, {} unchanged".format(written, len(models) - written))
+        else:
+            self.report({'INFO'}, "Generated {} QCs".format(len(models)))
+        report_profile(context, profiler, self)
+        return{'FINISHED'}
+
+class QC_OT_MakeLODs(Operator):
+    """Create the missing LODs of the reference model from copies of its meshes with a Decimate modifier"""
+    bl_idname = "qcgen.make_lods"
+    bl_label = "Create Missing LODs"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        from .qcfile import ExportIndex, classify_export_items, collection_tree, lod_name
+        qcgen = context.scene.qcgen
+        export_list = context.scene.vs.export_list
+
+        index = ExportIndex(export_list)
+        reference, bodies, lods, physics, sequences = classify_export_items(export_list, index.get(qcgen.collisionmodel))
+        if reference is None:
+            self.report({'ERROR'}, "No reference model in the export list")
+            return{'CANCELLED'}
+
+        if reference.collection:
+            source = reference.collection
+            objects = [ob for ob in source.all_objects if ob.type == 'MESH']
+            parents = [coll for coll in collection_tree(context.scene.collection) if source.name in coll.children]
+        else:
+            source = reference.obj
+            objects = [source] if source.type == 'MESH' else []
+            parents = list(source.users_collection)
+        if not objects:
+            self.report({'ERROR'}, "The reference model has no meshes to decimate")
+            return{'CANCELLED'}
+
+        created = []
+        for level in range(1, qcgen.lod_count + 1):
+            if level in lods:
+                continue
+            ratio = qcgen.lod_ratio ** level
+
+            # the copies share the reference's meshes, Blender Source Tools applies the modifier on export
+            copies = []
+            for ob in objects:
+                copy = ob.copy()
+                copy.name = lod_name(ob.name, level)
+                decimate = copy.modifiers.new("LOD Decimate", 'DECIMATE')
+                decimate.ratio = ratio
+                copies.append(copy)
+
+            name = lod_name(source.name, level)
+            if reference.collection:
+                coll = bpy.data.collections.new(name)
+                for parent in parents:
+                    parent.children.link(coll)
+                for copy in copies:
+                    coll.objects.link(copy)
+            else:
+                copies[0].name = name
+                for parent in parents:
+                    parent.objects.link(copies[0])
+            created.append(name)
+
+        if not created:
+            self.report({'INFO'}, "All {} LODs already exist".format(qcgen.lod_count))
+        else:
+            self.report({'INFO'}, "Created {}, export them before writing the QC".format(", ".join(created)))
         return{'FINISHED'}
 
+def autofill_vs_paths(context):
+    """Deduce the Source Engine paths from where the .blend file is.
+    Returns an error message, or None on success."""
+    
+    # root/content/modelsrc/props_c17
+    curdir = os.path.dirname(bpy.data.filepath)
+
+    i = curdir.find('content')
+
+    if i < 0:
+        return "Your current path does not have a 'content' folder."
+
+    j = i + len('content') + 1
+    k = j + curdir[j:].replace('\\', '/').find('/')
+    
+    if j > len(curdir) or k < j:
+        return "Could not deduce game folder name."
+
+    
+    # hl2
+    gamedirname = curdir[j:k]
+    # root/game
+    gamedir = os.path.join(curdir[:i], 'game')
+
+    # root/game/bin
+    context.scene.vs.engine_path = os.path.join(gamedir, 'bin')
+
+    # root/game/hl2
+    context.scene.vs.game_path = os.path.join(gamedir, gamedirname)
+
+    if not context.scene.vs.export_path:
+        context.scene.vs.export_path = "//"
+
+    i = curdir.find('models')
+    j = i + curdir[i:].replace('\\', '/').find('/') + 1
+    
+    modelpath = os.path.dirname(curdir[j:])
+    modelname = os.path.basename(bpy.data.filepath).replace('.blend', '.mdl')
+
+    context.scene.qcgen.modelname = os.path.join(modelpath, modelname)
+    context.scene.qcgen.cdmaterials = os.path.join('models', modelpath)
+
+    return None
+
+def read_text_file(path):
+    """Contents of a text file, or None if it can't be read"""
+    try:
+        with open(path, 'r', encoding='utf8') as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+def default_qc_path():
+    """<blend dir>/<blend name>.qc"""
+    qc_path = os.path.splitext(os.path.basename(bpy.data.filepath))[0] + ".qc"
+    return os.path.join(os.path.dirname(bpy.data.filepath), qc_path)
+
 class QC_OT_AutofillVS(Operator):
     """Automatically determine paths for Source Engine Export"""
     bl_idname = "qcgen.autofill_vs"
@@ -313,47 +705,153 @@ class QC_OT_AutofillVS(Operator):
         if not context.scene.vs:
             return{'FINISHED'}
         
-        # root/content/modelsrc/props_c17
-        curdir = os.path.dirname(bpy.data.filepath)
+        error = autofill_vs_paths(context)
+        if error:
+            self.report({'ERROR'}, error)
 
-        i = curdir.find('content')
+        return{'FINISHED'}
 
-        if i < 0:
-            self.report({'ERROR'}, "Your current path does not have a 'content' folder.")
-            return{'FINISHED'}
+def get_studiomdl_path(context):
+    prefs = get_preferences(context)
+    if prefs and prefs.studiomdl_path:
+        return bpy.path.abspath(prefs.studiomdl_path)
+    return os.path.join(bpy.path.abspath(context.scene.vs.engine_path), "studiomdl.exe")
 
-        j = i + len('content') + 1
-        k = j + curdir[j:].replace('\\', '/').find('/')
-        
-        if j > len(curdir) or k < j:
-            self.report({'ERROR'}, "Could not deduce game folder name.")
-            return{'FINISHED'}
+def qc_files_to_compile(context):
+    """The QCs matched by Blender Source Tools' QC Path, or else the one Write QC wrote"""
+    from .studiomdl import find_qc_files
+    qc_files = find_qc_files(bpy.path.abspath(context.scene.vs.qc_path))
+    if qc_files:
+        return qc_files
 
-        
-        # hl2
-        gamedirname = curdir[j:k]
-        # root/game
-        gamedir = os.path.join(curdir[:i], 'game')
+    qc_text = context.scene.qcgen.qc_text
+    qc_path = bpy.path.abspath(qc_text.filepath) if qc_text and qc_text.filepath else default_qc_path()
+    return [qc_path] if os.path.isfile(qc_path) else []
 
-        # root/game/bin
-        context.scene.vs.engine_path = os.path.join(gamedir, 'bin')
+# compiles currently running in QC_OT_CompileQC, for the panel's progress/cancel UI
+running_builds = []
 
-        # root/game/hl2
-        context.scene.vs.game_path = os.path.join(gamedir, gamedirname)
+class QC_OT_CompileQC(Operator):
+    """Compile the QC files with studiomdl, several at once. Press ESC or Cancel to stop"""
+    bl_idname = "qcgen.compile"
+    bl_label = "Compile QC"
 
-        if not context.scene.vs.export_path:
-            context.scene.vs.export_path = "//"
+    cancel_requested = False
 
-        i = curdir.find('models')
-        j = i + curdir[i:].replace('\\', '/').find('/') + 1
-        
-        modelpath = os.path.dirname(curdir[j:])
-        modelname = os.path.basename(bpy.data.filepath).replace('.blend', '.mdl')
+    def execute(self, context):
+        from .jobs import JobQueue
+        from .studiomdl import studiomdl_job
 
-        context.scene.qcgen.modelname = os.path.join(modelpath, modelname)
-        context.scene.qcgen.cdmaterials = os.path.join('models', modelpath)
+        if not context.scene.vs:
+            return{'CANCELLED'}
+
+        studiomdl = get_studiomdl_path(context)
+        if not os.path.isfile(studiomdl):
+            self.report({'ERROR'}, "Can't find studiomdl: " + studiomdl)
+            return{'CANCELLED'}
+
+        qc_files = qc_files_to_compile(context)
+        if not qc_files:
+            self.report({'ERROR'}, "No QC files to compile, write one first or set the QC Path")
+            return{'CANCELLED'}
+
+        prefs = get_preferences(context)
+        jobs = [studiomdl_job(studiomdl, context.scene.vs.game_path, qc_path) for qc_path in qc_files]
+        self.queue = JobQueue(jobs, prefs.studiomdl_jobs if prefs else None)
+        self.cancelled = False
+        self.logs = {}
+        for job in jobs:
+            log = bpy.data.texts.get(job.name + ".log") or bpy.data.texts.new(job.name + ".log")
+            log.clear()
+            self.logs[job] = log
+
+        # no event loop in background mode, just wait for the jobs
+        if context.window is None:
+            self.queue.wait()
+            for job in self.queue.finished:
+                self.logs[job].write("".join(ln + "\n" for ln in job.log))
+            return self.finish(context)
+
+        wm = context.window_manager
+        wm.progress_begin(0, self.queue.total)
+        self._timer = wm.event_timer_add(0.1, window=context.window)
+        wm.modal_handler_add(self)
+        running_builds.append(self)
+        self.update_jobs(context)
+        return{'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC' or (self.cancel_requested and not self.cancelled):
+            self.cancelled = True
+            self.queue.cancel()
+        elif event.type != 'TIMER':
+            return{'PASS_THROUGH'}
+
+        self.update_jobs(context)
+        if self.queue.done:
+            return self.finish(context)
+        return{'PASS_THROUGH'}
+
+    def update_jobs(self, context):
+        self.queue.update()
+        for job in self.queue.running + self.queue.finished:
+            lines = job.read_lines()
+            if lines:
+                self.logs[job].write("".join(ln + "\n" for ln in lines))
+
+        context.window_manager.progress_update(len(self.queue.finished))
+        for area in context.screen.areas if context.screen else ():
+            if area.type in {'TEXT_EDITOR', 'PROPERTIES'}:
+                area.tag_redraw()
+
+    @property
+    def progress(self):
+        return len(self.queue.finished), self.queue.total
+
+    def finish(self, context):
+        from .studiomdl import parse_errors, format_error
+
+        if context.window is not None:
+            wm = context.window_manager
+            wm.event_timer_remove(self._timer)
+            wm.progress_end()
+        if self in running_builds:
+            running_builds.remove(self)
+
+        failed = 0
+        for job in self.queue.finished:
+            job.read_lines()
+            if job.succeeded:
+                continue
+            failed += 1
+            errors = parse_errors(job.log)
+            if job.cancelled:
+                msg = "cancelled"
+            elif errors:
+                msg = "; ".join(format_error(e) for e in errors[:3])
+            else:
+                msg = "studiomdl exited with {}".format(job.returncode)
+            self.report({'ERROR'}, "{}: {} (see {}.log)".format(job.name, msg, job.name))
+
+        msg = "Compiled {} of {} QC files".format(self.queue.total - failed, self.queue.total)
+        if self.cancelled:
+            self.report({'WARNING'}, "Cancelled. " + msg)
+            return{'CANCELLED'}
+        self.report({'WARNING'} if failed else {'INFO'}, msg)
+        return{'FINISHED'}
 
+class QC_OT_CancelCompile(Operator):
+    """Stop the running QC compiles"""
+    bl_idname = "qcgen.compile_cancel"
+    bl_label = "Cancel QC Compile"
 
+    @classmethod
+    def poll(cls, context):
+        return len(running_builds) > 0
+
+    def execute(self, context):
+        for build in running_builds:
+            build.cancel_requested = True
         return{'FINISHED'}
 
 class BasePanel(bpy.types.Panel):
@@ -390,6 +888,14 @@ class QC_PT_QCPanel(BasePanel, bpy.types.Panel):
 
         layout.operator("qcgen.write", text="Write QC")
 
+        if running_builds:
+            done, total = running_builds[0].progress
+            row = layout.row()
+            row.label(text="Compiling {}/{}...".format(done, total), icon='TIME')
+            row.operator("qcgen.compile_cancel", text="Cancel", icon='CANCEL')
+        elif context.scene.vs:
+            layout.operator("qcgen.compile", icon='EXPORT')
+
 class QC_PT_Paths(BasePanel, bpy.types.Panel):
     bl_parent_id = "QC_PT_QCPanel"
     bl_label = "Paths"
@@ -413,6 +919,15 @@ class QT_PT_QCOutput(BasePanel, bpy.types.Panel):
 
         layout.prop(qcgen, 'open_in_text_editor')
         layout.prop(qcgen, 'save_qc_file')
+        layout.prop(qcgen, 'preflight')
+
+        layout.prop(qcgen, 'multi_qc')
+        if qcgen.multi_qc:
+            row = layout.row()
+            row.template_list("QC_UL_ModelList", "", qcgen, "models", qcgen, "models_active", rows=3)
+            col = row.column(align=True)
+            col.operator("qcgen.models_add", icon='ADD', text="")
+            col.operator("qcgen.models_remove", icon='REMOVE', text="")
 
 class QT_PT_QCModel(BasePanel, bpy.types.Panel):
     bl_parent_id = "QC_PT_QCPanel"
@@ -443,27 +958,55 @@ class QT_PT_QCPhysics(BasePanel, bpy.types.Panel):
         col.enabled = qcgen.use_collisionjoints
         col.prop(qcgen, 'generate_bone_followers')
 
+        col = col.column()
+        col.enabled = qcgen.use_collisionjoints and qcgen.generate_bone_followers
+        col.prop(qcgen, 'bone_filter')
+        if qcgen.bone_filter == 'COLLECTION':
+            col.prop(qcgen, 'bone_collection')
+        col.prop(qcgen, 'bone_include')
+        col.prop(qcgen, 'bone_exclude')
+
         #layout.prop(qcgen, "contents")
 
+class QT_PT_QCLods(BasePanel, bpy.types.Panel):
+    bl_parent_id = "QC_PT_QCPanel"
+    bl_label = "LODs"
+    qc_icon = 'MOD_DECIM'
+
+    def paint(self, qcgen, layout, context):
+        layout.prop(qcgen, 'lod_distance')
+        layout.prop(qcgen, 'lod_count')
+        layout.prop(qcgen, 'lod_ratio')
+        layout.operator("qcgen.make_lods", icon='MOD_DECIM')
+
 from .vmt_generator import VMT_Properties, classes_vmt
 
 classes = (    
     QC_Body,
+    QC_Model,
     QC_Properties,
+    QC_Preferences,
 
     QC_UL_BodyList,
     QC_OT_AddBody,
     QC_OT_RemoveBody,
     QC_OT_MoveBody,
+    QC_UL_ModelList,
+    QC_OT_AddModel,
+    QC_OT_RemoveModel,
 
     QC_OT_WriteQC,
     QC_OT_AutofillVS,
+    QC_OT_CompileQC,
+    QC_OT_CancelCompile,
+    QC_OT_MakeLODs,
 
     QC_PT_QCPanel,
     QC_PT_Paths,
     QT_PT_QCOutput,
     QT_PT_QCModel,
     QT_PT_QCPhysics,
+    QT_PT_QCLods,
 ) + classes_vmt
 
 
@@ -478,8 +1021,14 @@ def register():
     bpy.types.Scene.qcgen = make_pointer(QC_Properties)
     bpy.types.Scene.vmtgen = make_pointer(VMT_Properties)
 
+    from . import vmt_generator
+    vmt_generator.register()
+
 
 def unregister():
+    from . import vmt_generator
+    vmt_generator.unregister()
+
     from bpy.utils import unregister_class
     for cl in classes:
         unregister_class(cl)
@@ -1,37 +1,58 @@
 import os
 import bpy
 import sys
-import typing
+import json
+import time
 import inspect
 import pkgutil
 import importlib
 from pathlib import Path
+from collections import defaultdict, deque
 
 __all__ = (
     "init",
     "register",
     "unregister",
+    "print_timings",
 )
 
 modules = None
 ordered_classes = None
 
-def init():
+# seconds spent in each step of init() and register(), see print_timings()
+timings = {}
+class_timings = {}
+
+def init(use_cache=True):
     global modules
     global ordered_classes
 
-    modules = get_all_submodules(Path(__file__).parent)
-    ordered_classes = get_ordered_classes_to_register(modules)
+    timings.clear()
+    with timed("import modules"):
+        modules = get_all_submodules(Path(__file__).parent)
+    with timed("order classes"):
+        ordered_classes = None
+        if use_cache:
+            ordered_classes = load_cached_order(modules)
+        if ordered_classes is None:
+            ordered_classes = get_ordered_classes_to_register(modules)
+            if use_cache:
+                save_cached_order(modules, ordered_classes)
 
 def register():
-    for cls in ordered_classes:
-        bpy.utils.register_class(cls)
+    class_timings.clear()
+    with timed("register classes"):
+        for cls in ordered_classes:
+            start = time.perf_counter()
+            bpy.utils.register_class(cls)
+            class_timings[cls] = time.perf_counter() - start
 
-    for module in modules:
-        if module.__name__ == __name__:
-            continue
-        if hasattr(module, "register"):
-            module.register()
+    with timed("register modules"):
+        for module in modules:
+            if module.__name__ == __name__:
+                continue
+            if hasattr(module, "register"):
+                module.register()
 
 def unregister():
     for cls in reversed(ordered_classes):
@@ -80,16 +101,33 @@ def get_register_deps_dict(modules):
 def iter_own_register_deps(cls, own_classes):
     yield from (dep for dep in iter_register_deps(cls) if dep in own_classes)
 
+# The raw annotations are read instead of typing.get_type_hints(), which
+# re-evaluates every annotation, and the result is kept per class.
+register_deps_cache = {}
+
 def iter_register_deps(cls):
-    for value in typing.get_type_hints(cls, {}, {}).values():
-        dependency = get_dependency_from_annotation(value)
-        if dependency is not None:
-            yield dependency
+    deps = register_deps_cache.get(cls)
+    if deps is None:
+        deps = []
+        for base in reversed(cls.__mro__):
+            for value in base.__dict__.get("__annotations__", {}).values():
+                dependency = get_dependency_from_annotation(value)
+                if dependency is not None:
+                    deps.append(dependency)
+        register_deps_cache[cls] = deps
+    yield from deps
 
 def get_dependency_from_annotation(value):
+    # (function, keywords) before Blender 2.93, bpy.props._PropertyDeferred since
     if isinstance(value, tuple) and len(value) == 2:
-        if value[0] in (bpy.props.PointerProperty, bpy.props.CollectionProperty):
-            return value[1]["type"]
+        function, keywords = value
+    elif hasattr(value, "function") and hasattr(value, "keywords"):
+        function, keywords = value.function, value.keywords
+    else:
+        return None
+
+    if function in (bpy.props.PointerProperty, bpy.props.CollectionProperty):
+        return keywords.get("type")
     return None
 
 def iter_classes_to_register(modules):
@@ -123,16 +161,114 @@ def get_register_base_types():
 # Find order to register to solve dependencies
 #################################################
 
+def class_key(cls):
+    return cls.__module__ + ":" + cls.__qualname__
+
 def toposort(deps_dict):
+    """Kahn's algorithm, O(classes + dependencies). Classes that are ready at
+    the same time are ordered by name so the order is stable between runs."""
+    dependents = defaultdict(list)
+    remaining = {}
+    for value, deps in deps_dict.items():
+        remaining[value] = len(deps)
+        for dep in deps:
+            dependents[dep].append(value)
+
+    ready = deque(sorted((value for value, count in remaining.items() if count == 0), key=class_key))
     sorted_list = []
-    sorted_values = set()
-    while len(deps_dict) > 0:
-        unsorted = []
-        for value, deps in deps_dict.items():
-            if len(deps) == 0:
-                sorted_list.append(value)
-                sorted_values.add(value)
-            else:
-                unsorted.append(value)
-        deps_dict = {value : deps_dict[value] - sorted_values for value in unsorted}
-    return sorted_list
\ No newline at end of file
+    while ready:
+        value = ready.popleft()
+        sorted_list.append(value)
+        unlocked = []
+        for dependent in dependents[value]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                unlocked.append(dependent)
+        ready.extend(sorted(unlocked, key=class_key))
+
+    if len(sorted_list) != len(deps_dict):
+        unsorted = {value for value, count in remaining.items() if count > 0}
+        cycle = sorted(class_key(value) for value in find_cycle_members(deps_dict, unsorted))
+        raise ValueError("Dependency cycle between classes: " + ", ".join(cycle))
+    return sorted_list
+
+def find_cycle_members(deps_dict, candidates):
+    """The candidates that depend on themselves, leaving out the ones that only
+    depend on a cycle. Only runs when there is one, so a search per class is fine."""
+    def reaches_itself(start):
+        seen = set()
+        stack = list(deps_dict[start])
+        while stack:
+            value = stack.pop()
+            if value is start:
+                return True
+            if value in candidates and value not in seen:
+                seen.add(value)
+                stack.extend(deps_dict[value])
+        return False
+    return [value for value in candidates if reaches_itself(value)]
+
+
+# Cache the order on disk, keyed by the modification times of the modules
+#################################################
+
+def get_cache_path():
+    return Path(__file__).parent / "__pycache__" / "auto_load_order.json"
+
+def get_modules_key(modules):
+    key = {}
+    for module in modules:
+        path = getattr(module, "__file__", None)
+        if path:
+            key[module.__name__] = os.stat(path).st_mtime_ns
+    return key
+
+def load_cached_order(modules):
+    try:
+        with open(get_cache_path(), "r", encoding="utf8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("modules") != get_modules_key(modules):
+        return None
+
+    classes = {class_key(cls): cls for cls in iter_classes_to_register(modules)}
+    if set(classes) != set(data.get("order", ())):
+        return None
+    return [classes[key] for key in data["order"]]
+
+def save_cached_order(modules, ordered_classes):
+    path = get_cache_path()
+    try:
+        path.parent.mkdir(exist_ok=True)
+        with open(path, "w", encoding="utf8") as f:
+            json.dump({
+                "modules": get_modules_key(modules),
+                "order": [class_key(cls) for cls in ordered_classes],
+            }, f, indent=1)
+    except OSError:
+        pass
+
+
+# Instrumentation
+#################################################
+
+class timed:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args):
+        timings[self.name] = timings.get(self.name, 0.0) + time.perf_counter() - self.start
+
+def print_timings(top=10):
+    print("auto_load timings:")
+    for name, seconds in timings.items():
+        print("  {:<24}{:8.2f}ms".format(name, seconds * 1000))
+    slowest = sorted(class_timings.items(), key=lambda item: item[1], reverse=True)[:top]
+    if slowest:
+        print("  slowest classes to register:")
+        for cls, seconds in slowest:
+            print("    {:<40}{:8.2f}ms".format(cls.__name__, seconds * 1000))
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""Regenerate the QC files of every .blend file under a directory.
+
+Run it with any Python 3 (Blender's works too), it starts one Blender
+process per .blend file, several at a time:
+
+    python batch_qc.py content/hl2mod/models --blender /path/to/blender -j 8
+
+Each Blender process runs this same script in background mode, deduces the
+paths like "Find Engine Path" does and writes <name>.qc next to the .blend.
+Blender Source Tools must be enabled in that Blender's user preferences.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+RESULT_PREFIX = "QCGEN_RESULT "
+
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# Worker, runs inside `blender --background file.blend --python batch_qc.py -- --worker`
+#################################################
+
+def run_worker(argv):
+    import bpy
+    import importlib
+    import addon_utils
+
+    parser = argparse.ArgumentParser(prog="batch_qc.py --worker")
+    parser.add_argument("--worker", action="store_true")
+    parser.add_argument("--no-autofill", action="store_true")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    result = {'file': bpy.data.filepath, 'ok': False, 'qc': None, 'message': ""}
+    try:
+        addon_utils.enable("io_scene_valvesource", default_set=False)
+
+        # import the add-on from wherever this script is, installed or not
+        sys.path.insert(0, os.path.dirname(ADDON_DIR))
+        addon = importlib.import_module(os.path.basename(ADDON_DIR))
+        if not hasattr(bpy.types.Scene, 'qcgen'):
+            addon.register()
+
+        qc_from_vs = importlib.import_module(addon.__name__ + '.qcfile').qc_from_vs
+
+        context = bpy.context
+        if not getattr(context.scene, 'vs', None):
+            raise RuntimeError("Blender Source Tools is not enabled")
+
+        if not args.no_autofill:
+            error = addon.autofill_vs_paths(context)
+            if error:
+                raise RuntimeError(error)
+
+        # leave the file alone if it's already up to date
+        qc_path = addon.default_qc_path()
+        qctxt = qc_from_vs(context)
+        changed = qctxt != addon.read_text_file(qc_path)
+        if changed:
+            with open(qc_path, 'w', encoding='utf8') as f:
+                f.write(qctxt)
+
+        result.update(ok=True, qc=qc_path, message="" if changed else "unchanged")
+    except Exception as e:
+        result['message'] = "{}: {}".format(type(e).__name__, e)
+
+    result['seconds'] = time.perf_counter() - start
+    print(RESULT_PREFIX + json.dumps(result), flush=True)
+    return 0 if result['ok'] else 1
+
+
+# Driver
+#################################################
+
+def find_blend_files(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith('.blend'):
+                yield os.path.join(dirpath, filename)
+
+def parse_result(job):
+    for line in reversed(job.log):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    return None
+
+def run_driver(argv):
+    sys.path.insert(0, ADDON_DIR)
+    from jobs import ProcessJob, JobQueue
+
+    parser = argparse.ArgumentParser(description="Write QC files for every .blend file under a directory.")
+    parser.add_argument("root", help="directory to search for .blend files")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"), help="Blender executable (default: $BLENDER or blender)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Blender processes to run at once")
+    parser.add_argument("--no-autofill", action="store_true", help="keep the paths saved in each .blend instead of deducing them")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print Blender's output for failed files")
+    args = parser.parse_args(argv)
+
+    worker_args = ["--", "--worker"] + (["--no-autofill"] if args.no_autofill else [])
+    jobs = [
+        ProcessJob(path, [args.blender, "--background", path, "--python-exit-code", "1",
+                          "--python", os.path.abspath(__file__)] + worker_args)
+        for path in find_blend_files(args.root)
+    ]
+    if not jobs:
+        print("No .blend files found under " + args.root)
+        return 1
+
+    print("Writing QC files for {} .blend files, {} at a time...".format(len(jobs), args.jobs))
+    start = time.perf_counter()
+    queue = JobQueue(jobs, args.jobs)
+    failed = 0
+    while not queue.done:
+        for job in queue.update():
+            job.read_lines()
+            result = parse_result(job)
+            ok = job.returncode == 0 and result and result['ok']
+            failed += not ok
+            message = (result or {}).get('message') or ("" if ok else "blender exited with {}".format(job.returncode))
+            print("{:<4} {:>7.2f}s  {}  {}".format("ok" if ok else "FAIL", job.elapsed,
+                os.path.relpath(job.name, args.root), message))
+            if not ok and args.verbose:
+                print("\n".join("\t" + ln for ln in job.log))
+        for job in queue.running:
+            job.read_lines()
+        time.sleep(0.05)
+
+    print("\n{} written, {} failed in {:.2f}s".format(len(jobs) - failed, failed, time.perf_counter() - start))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    if "--worker" in sys.argv:
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+        sys.exit(run_worker(argv))
+    else:
+        sys.exit(run_driver(sys.argv[1:]))
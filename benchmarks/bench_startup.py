@@ -0,0 +1,75 @@
+"""Measures how long enabling the add-on takes.
+
+Runs inside Blender, from a factory startup so other add-ons don't skew it:
+
+    blender --background --factory-startup --python benchmarks/bench_startup.py -- -n 20
+
+Reports the cold import of the package, register() and unregister(), and
+which of the add-on's modules got imported just by enabling it. Then times
+auto_load.init(), which imports every module and orders the classes, without
+and with its cache (register() uses its own class list, not auto_load).
+"""
+import os
+import sys
+import time
+import argparse
+import importlib
+import statistics
+
+import bpy
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="bench_startup.py")
+    parser.add_argument("-n", "--repeat", type=int, default=20, help="register/unregister cycles")
+    args = parser.parse_args(argv)
+
+    package = os.path.basename(ADDON_DIR)
+    sys.path.insert(0, os.path.dirname(ADDON_DIR))
+
+    before = set(sys.modules)
+    import_time = timed(lambda: importlib.import_module(package))
+    addon = sys.modules[package]
+
+    register_times = []
+    unregister_times = []
+    for i in range(args.repeat):
+        register_times.append(timed(addon.register))
+        if i == 0:
+            loaded = sorted(name for name in set(sys.modules) - before if name.startswith(package))
+        unregister_times.append(timed(addon.unregister))
+
+    def ms(t):
+        return "{:8.2f}ms".format(t * 1000)
+
+    print()
+    print("Blender {}, {} register/unregister cycles".format(bpy.app.version_string, args.repeat))
+    print("{:<24}{}".format("import (cold)", ms(import_time)))
+    for name, times in (("register", register_times), ("unregister", unregister_times)):
+        print("{:<24}{}  min{}  median{}".format(name + " (first)", ms(times[0]), ms(min(times)), ms(statistics.median(times))))
+    print("{:<24}{}".format("enable (cold)", ms(import_time + register_times[0])))
+    print()
+    print("Modules loaded by enabling the add-on:")
+    for name in loaded:
+        print("\t" + name)
+
+    auto_load = importlib.import_module(package + ".auto_load")
+    print()
+    print("No cache:")
+    auto_load.init(use_cache=False)
+    auto_load.print_timings()
+    auto_load.init(use_cache=True)   # writes the cache
+    auto_load.init(use_cache=True)
+    print("From the cache:")
+    auto_load.print_timings()
+
+
+if __name__ == "__main__":
+    main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
@@ -0,0 +1,140 @@
+"""Checks the built-in VTF compiler's output by decoding it again.
+
+Encodes a color gradient and an alpha ramp to DXT1/DXT5 and decodes them
+with the small decoder below, then writes whole VTFs and reads their headers
+and top mips back. Exits with 1 if a check fails. Runs with a plain Python
+interpreter and NumPy, Blender is not needed:
+
+    python benchmarks/check_vtf.py
+"""
+import os
+import sys
+import shutil
+import tempfile
+import importlib.util
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+spec = importlib.util.spec_from_file_location("vtf", os.path.join(ROOT, "vtf.py"))
+vtf = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(vtf)
+
+# largest error of a decoded channel, 565 rounding alone is up to 4
+MAX_COLOR_ERROR = 12
+MAX_ALPHA_ERROR = 4
+
+
+def decode_dxt(data, width, height, dxt5=False):
+    """(height, width, 4) uint8 pixels of DXT1 or DXT5 data, in 4 color mode only
+    like compress_dxt() writes it"""
+    block = np.frombuffer(data, dtype=vtf.DXT5_BLOCK if dxt5 else vtf.DXT1_BLOCK)
+    shifts = np.arange(16, dtype=np.uint64)
+
+    def unpack(c):
+        c = c.astype(np.uint32)
+        r, g, b = c >> 11, (c >> 5) & 63, c & 31
+        return np.stack([(r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)], axis=1).astype(np.float32)
+
+    e0, e1 = unpack(block['c0']), unpack(block['c1'])
+    palette = np.stack([e0, e1, (2 * e0 + e1) / 3, (e0 + 2 * e1) / 3], axis=1)
+    index = (block['index'][:, None].astype(np.uint64) >> (2 * shifts)) & 3
+    rgba = np.empty((len(block), 16, 4), dtype=np.float32)
+    rgba[..., :3] = np.take_along_axis(palette, index[:, :, None].astype(np.intp), axis=1)
+    rgba[..., 3] = 255
+
+    if dxt5:
+        a0, a1 = block['a0'].astype(np.float32), block['a1'].astype(np.float32)
+        steps = np.arange(1, 7, dtype=np.float32)
+        alphas = np.concatenate([a0[:, None], a1[:, None],
+                                 ((7 - steps) * a0[:, None] + steps * a1[:, None]) / 7], axis=1)
+        bits = np.zeros(len(block), dtype=np.uint64)
+        for k in range(6):
+            bits |= block['aindex'][:, k].astype(np.uint64) << np.uint64(8 * k)
+        aindex = (bits[:, None] >> (3 * shifts)) & 7
+        rgba[..., 3] = np.take_along_axis(alphas, aindex.astype(np.intp), axis=1)
+
+    bw, bh = max(1, (width + 3) // 4), max(1, (height + 3) // 4)
+    pixels = rgba.reshape(bh, bw, 4, 4, 4).swapaxes(1, 2).reshape(bh * 4, bw * 4, 4)
+    return np.rint(pixels[:height, :width]).astype(np.uint8)
+
+def max_error(a, b):
+    return int(np.abs(a.astype(np.int16) - b.astype(np.int16)).max())
+
+
+def gradient(width, height, alpha=False):
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.empty((height, width, 4), dtype=np.uint8)
+    pixels[..., 0] = x * 255 // (width - 1)
+    pixels[..., 1] = y * 255 // (height - 1)
+    pixels[..., 2] = (x + y) * 255 // (width + height - 2)
+    pixels[..., 3] = x * 255 // (width - 1) if alpha else 255
+    return pixels
+
+def check_blocks(failures):
+    flat = np.full((8, 8, 4), (200, 100, 50, 255), dtype=np.uint8)
+    for name, pixels, dxt5 in (("DXT1 gradient", gradient(64, 64), False),
+                               ("DXT5 gradient and alpha ramp", gradient(64, 64, alpha=True), True),
+                               ("DXT1 flat color", flat, False)):
+        decoded = decode_dxt(vtf.compress_dxt(pixels, dxt5), pixels.shape[1], pixels.shape[0], dxt5)
+        color, alpha = max_error(decoded[..., :3], pixels[..., :3]), max_error(decoded[..., 3], pixels[..., 3])
+        print("{:<32} color error {:>3}, alpha error {:>3}".format(name, color, alpha))
+        if color > MAX_COLOR_ERROR or alpha > MAX_ALPHA_ERROR:
+            failures.append(name)
+
+def check_files(failures, out_dir):
+    rgb = gradient(64, 32)[..., :3]
+    rgba = gradient(64, 32, alpha=True)
+    cases = (
+        # name, pixels, settings, expected (format, mip count)
+        ("RGB", rgb, {}, (vtf.IMAGE_FORMAT_DXT1, 7)),
+        ("RGBA", rgba, {}, (vtf.IMAGE_FORMAT_DXT5, 7)),
+        ("RGB nocompress", rgb, {'nocompress': "1"}, (vtf.IMAGE_FORMAT_BGR888, 7)),
+        ("RGBA nocompress nomip", rgba, {'nocompress': "1", 'nomip': "1"}, (vtf.IMAGE_FORMAT_RGBA8888, 1)),
+    )
+    for name, pixels, settings, expected in cases:
+        path = os.path.join(out_dir, name.replace(" ", "_") + ".vtf")
+        written = vtf.write_vtf(path, pixels, settings)
+        info = vtf.read_header(path)
+        height, width = pixels.shape[:2]
+
+        # the top mip is the last image in the file
+        top_size = vtf.image_size(info.image_format, width, height)
+        with open(path, 'rb') as f:
+            f.seek(-top_size, os.SEEK_END)
+            data = f.read()
+        if info.image_format in (vtf.IMAGE_FORMAT_DXT1, vtf.IMAGE_FORMAT_DXT5):
+            decoded = decode_dxt(data, width, height, info.image_format == vtf.IMAGE_FORMAT_DXT5)
+        elif info.image_format == vtf.IMAGE_FORMAT_BGR888:
+            decoded = vtf.to_rgba(np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)[..., ::-1])
+        else:
+            decoded = np.frombuffer(data, dtype=np.uint8).reshape(height, width, 4)
+        error = max_error(decoded, vtf.to_rgba(pixels))
+
+        size = (info.low_res_offset + vtf.image_size(info.low_res_format, info.low_res_width, info.low_res_height)
+                + vtf.mip_chain_size(info.image_format, width, height, 1, info.mip_count))
+        ok = (written == expected and (info.image_format, info.mip_count) == expected
+              and (info.width, info.height) == (width, height)
+              and os.path.getsize(path) == size and error <= MAX_COLOR_ERROR)
+        print("{:<24} {:<60} top mip error {:>3}  {}".format(name, vtf.describe(info), error, "ok" if ok else "FAILED"))
+        if not ok:
+            failures.append(name)
+
+
+def main():
+    failures = []
+    check_blocks(failures)
+    out_dir = tempfile.mkdtemp(prefix="qcgen_vtf_")
+    try:
+        check_files(failures, out_dir)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    if failures:
+        print("\nFAILED: " + ", ".join(failures))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,657 @@
+"""Stand-ins for bpy and io_scene_valvesource, enough to run the add-on's
+generators, operators and panels on a plain Python interpreter.
+
+They only model what the add-on touches. Timings are relative and are
+meant to catch regressions and show how each path scales; they are not
+Blender's absolute numbers.
+
+    import fakebpy
+    fakebpy.install()
+    addon = fakebpy.load_addon()
+    context = fakebpy.make_scene(fakebpy.SceneSpec(bones=300))
+"""
+import os
+import sys
+import types
+import fnmatch
+import importlib.util
+from dataclasses import dataclass
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADDON_NAME = "qc_generator"
+
+
+class NS(types.SimpleNamespace):
+    """Namespace that is hashable by identity, like Blender's structs"""
+    __hash__ = object.__hash__
+    __eq__ = object.__eq__
+
+
+# bpy.props
+#################################################
+
+class _PropertyDeferred:
+    def __init__(self, function, keywords):
+        self.function = function
+        self.keywords = keywords
+
+def _prop_function(name):
+    def function(**keywords):
+        return _PropertyDeferred(function, keywords)
+    function.__name__ = name
+    return function
+
+PROPERTY_NAMES = (
+    "BoolProperty", "IntProperty", "FloatProperty", "StringProperty", "EnumProperty",
+    "PointerProperty", "CollectionProperty", "FloatVectorProperty", "IntVectorProperty",
+    "BoolVectorProperty",
+)
+props = types.ModuleType("bpy.props")
+for _name in PROPERTY_NAMES:
+    setattr(props, _name, _prop_function(_name))
+props.__all__ = PROPERTY_NAMES
+
+
+def property_default(deferred):
+    function, keywords = deferred.function, deferred.keywords
+    name = function.__name__
+    if 'default' in keywords:
+        return keywords['default']
+    if name == "EnumProperty":
+        return keywords['items'][0][0]
+    if name == "CollectionProperty":
+        return PropCollection(item_type=keywords.get('type'))
+    return {
+        "BoolProperty": False, "IntProperty": 0, "FloatProperty": 0.0,
+        "StringProperty": "", "PointerProperty": None,
+    }.get(name)
+
+
+# bpy.types
+#################################################
+
+class ArrayCollection:
+    """bpy_prop_collection of mesh elements, only for foreach_get()"""
+
+    def __init__(self, length, **arrays):
+        self.length = length
+        self.arrays = arrays
+
+    def __len__(self):
+        return self.length
+
+    def foreach_get(self, attr, buffer):
+        import numpy as np
+        buffer[:] = np.ravel(self.arrays[attr])
+
+class PixelArray:
+    """Image.pixels, only for len() and foreach_get()"""
+
+    def __init__(self, values=()):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def foreach_get(self, buffer):
+        buffer[:] = self.values
+
+
+class PropCollection(list):
+    """bpy_prop_collection: a list that can also be indexed by name"""
+
+    def __init__(self, items=(), item_type=None, new=None):
+        super().__init__(items)
+        self.item_type = item_type
+        self._new = new
+        self._by_name = None
+
+    def _index(self):
+        if self._by_name is None or len(self._by_name) != len(self):
+            self._by_name = {}
+            for item in self:
+                self._by_name.setdefault(item.name, item)
+        return self._by_name
+
+    def get(self, name, default=None):
+        return self._index().get(name, default)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            item = self.get(key)
+            if item is None:
+                raise KeyError(key)
+            return item
+        return super().__getitem__(key)
+
+    def __contains__(self, item):
+        if isinstance(item, str):
+            return item in self._index()
+        return super().__contains__(item)
+
+    def new(self, name, *args):
+        item = self._new(name, *args)
+        self.append(item)
+        self._by_name = None
+        return item
+
+    def add(self):
+        item = self.item_type()
+        self.append(item)
+        return item
+
+    def remove(self, item):
+        if isinstance(item, int):
+            del self[item]
+        else:
+            super().remove(item)
+        self._by_name = None
+
+
+class RNAStruct:
+    """Python-defined struct (PropertyGroup, Operator...) with its
+    annotated properties set to their defaults"""
+    bl_rna = NS(properties=())
+
+    def __init__(self):
+        for base in reversed(type(self).__mro__):
+            for key, value in base.__dict__.get('__annotations__', {}).items():
+                if isinstance(value, _PropertyDeferred):
+                    object.__setattr__(self, key, property_default(value))
+
+    __hash__ = object.__hash__
+
+
+class PointerDescriptor:
+    """Scene.qcgen = PointerProperty(type=...) on a registered type"""
+
+    def __init__(self, name, struct_type):
+        self.name = '_' + name
+        self.struct_type = struct_type
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = instance.__dict__.get(self.name)
+        if value is None:
+            value = instance.__dict__[self.name] = self.struct_type()
+        return value
+
+
+class IDTypeMeta(type):
+    def __setattr__(cls, name, value):
+        if isinstance(value, _PropertyDeferred) and value.function.__name__ == "PointerProperty":
+            value = PointerDescriptor(name, value.keywords['type'])
+        super().__setattr__(name, value)
+
+
+class ID(NS, metaclass=IDTypeMeta):
+    def __init__(self, name="", **kwargs):
+        kwargs.setdefault('users', 1)
+        kwargs.setdefault('use_fake_user', False)
+        super().__init__(name=name, **kwargs)
+
+    def __repr__(self):
+        return "bpy.data.{}s[{!r}]".format(type(self).__name__.lower(), self.name)
+
+class Object(ID):
+    # evaluated objects and meshes are the originals, there are no modifiers
+    def evaluated_get(self, depsgraph):
+        return self
+
+    def to_mesh(self):
+        return self.data
+
+    def to_mesh_clear(self):
+        pass
+
+class Collection(ID): pass
+class Image(ID):
+    source = 'FILE'
+    size = (0, 0)
+    channels = 4
+    is_float = False
+    is_dirty = False
+    packed_file = None
+    colorspace_settings = NS(name='sRGB')
+    pixels = PixelArray()
+class Material(ID): pass
+class Action(ID): pass
+class Scene(ID): pass
+
+
+class Text(ID):
+    def __init__(self, name="Text", filepath=""):
+        super().__init__(name=name, filepath=filepath)
+        self._chunks = []
+
+    def clear(self):
+        self._chunks = []
+
+    def write(self, text):
+        self._chunks.append(text)
+
+    def as_string(self):
+        return ''.join(self._chunks)
+
+
+class Operator(RNAStruct):
+    def __init__(self):
+        super().__init__()
+        self.reports = []
+
+    def report(self, type, message):
+        self.reports.append((set(type), message))
+
+
+class Panel:
+    def __init__(self, layout=None):
+        self.layout = layout or UILayout()
+
+
+class UIList(RNAStruct):
+    bitflag_filter_item = 1 << 30
+    layout_type = 'DEFAULT'
+    filter_name = ""
+    use_filter_sort_alpha = False
+    use_filter_sort_reverse = False
+    use_filter_invert = False
+
+
+class UI_UL_list:
+    @staticmethod
+    def filter_items_by_name(pattern, bitflag, items, propname="name", flags=None, reverse=False):
+        pattern = "*" + pattern.lower() + "*"
+        return [bitflag if fnmatch.fnmatchcase(getattr(item, propname).lower(), pattern) else 0 for item in items]
+
+    @staticmethod
+    def sort_items_by_name(items, propname="name"):
+        order = sorted(range(len(items)), key=lambda i: getattr(items[i], propname).lower())
+        neworder = [0] * len(items)
+        for new, old in enumerate(order):
+            neworder[old] = new
+        return neworder
+
+
+class UILayout:
+    """Counts the widgets a draw() creates. template_list() runs the UIList's
+    filter_items() and draws the visible rows, like Blender does."""
+
+    def __init__(self, root=None):
+        self.root = root or self
+        self.widgets = 0
+        self.use_property_split = False
+        self.use_property_decorate = False
+        self.enabled = True
+        self.alignment = 'EXPAND'
+
+    def _widget(self):
+        self.root.widgets += 1
+
+    def _sub(self, *args, **kwargs):
+        self._widget()
+        return UILayout(self.root)
+
+    row = column = column_flow = box = split = _sub
+
+    def label(self, **kwargs):
+        self._widget()
+
+    def prop(self, *args, **kwargs):
+        self._widget()
+
+    def separator(self, **kwargs):
+        pass
+
+    def operator(self, idname, **kwargs):
+        self._widget()
+        return NS()
+
+    def enum_item_name(self, data, prop, identifier):
+        return identifier
+
+    def template_list(self, listtype_name, list_id, dataptr, propname, active_dataptr, active_propname, rows=5, **kwargs):
+        ui_list = getattr(types_module, listtype_name)()
+        items = getattr(dataptr, propname)
+        flags, order = None, None
+        if hasattr(ui_list, 'filter_items'):
+            flags, order = ui_list.filter_items(context, dataptr, propname)
+
+        visible = [i for i in range(len(items)) if not flags or flags[i]]
+        if order:
+            visible.sort(key=lambda i: order[i])
+        for i in visible[:rows]:
+            ui_list.draw_item(context, UILayout(self.root), dataptr, items[i], 0, active_dataptr, active_propname, i)
+        self._widget()
+
+
+class DynamicTypes(types.ModuleType):
+    """bpy.types: registered classes can be looked up by name"""
+
+types_module = DynamicTypes("bpy.types")
+for _cls in (RNAStruct, ID, Object, Collection, Image, Material, Action, Scene, Text,
+             Operator, Panel, UIList, UI_UL_list, UILayout):
+    setattr(types_module, _cls.__name__, _cls)
+types_module.PropertyGroup = type("PropertyGroup", (RNAStruct,), {})
+types_module.AddonPreferences = type("AddonPreferences", (RNAStruct,), {})
+types_module.Menu = type("Menu", (Panel,), {})
+types_module.Header = type("Header", (Panel,), {})
+types_module.bpy_prop_collection = PropCollection
+types_module.Context = NS
+for _name in PROPERTY_NAMES:
+    setattr(types_module, _name, type(_name, (), {}))
+
+
+# bpy.utils, bpy.path, bpy.app, bpy.ops
+#################################################
+
+def register_class(cls):
+    setattr(types_module, cls.__name__, cls)
+
+def unregister_class(cls):
+    if getattr(types_module, cls.__name__, None) is cls:
+        delattr(types_module, cls.__name__)
+
+utils = types.ModuleType("bpy.utils")
+utils.register_class = register_class
+utils.unregister_class = unregister_class
+
+
+def abspath(path, start=None):
+    if path.startswith("//"):
+        return os.path.join(start or os.path.dirname(data.filepath), path[2:])
+    return path
+
+def basename(path):
+    return os.path.basename(path[2:] if path.startswith("//") else path)
+
+def clean_name(name, replace="_"):
+    # like Blender's, which also replaces dots: "Untitled.001" -> "Untitled_001"
+    return "".join(c if (c.isascii() and c.isalnum()) or c in "_-" else replace for c in name)
+
+path = types.ModuleType("bpy.path")
+path.abspath = abspath
+path.basename = basename
+path.clean_name = clean_name
+
+
+class Timers:
+    def __init__(self):
+        self.registered = []
+
+    def register(self, function, first_interval=0, persistent=False):
+        self.registered.append(function)
+
+    def unregister(self, function):
+        self.registered.remove(function)
+
+    def is_registered(self, function):
+        return function in self.registered
+
+def persistent(function):
+    return function
+
+app = types.ModuleType("bpy.app")
+app.debug = False
+app.background = True
+app.version = (4, 1, 0)
+app.version_string = "fake"
+app.handlers = NS(depsgraph_update_post=[], load_post=[], save_post=[], persistent=persistent)
+app.timers = Timers()
+
+
+def text_new():
+    data.texts.new("Text")
+
+def text_open(filepath=""):
+    text = data.texts.new(os.path.basename(filepath))
+    text.filepath = filepath
+    with open(filepath, 'r', encoding='utf8') as f:
+        text.write(f.read())
+
+ops = types.ModuleType("bpy.ops")
+ops.text = NS(new=text_new, open=text_open)
+
+
+# bpy.data and bpy.context
+#################################################
+
+def new_data():
+    return NS(
+        filepath="",
+        objects=PropCollection(),
+        collections=PropCollection(),
+        images=PropCollection(new=lambda name, *args: Image(name, filepath="", type='IMAGE')),
+        materials=PropCollection(new=lambda name: Material(name, use_nodes=False, node_tree=None)),
+        texts=PropCollection(new=lambda name: Text(name)),
+        actions=PropCollection(),
+    )
+
+data = new_data()
+context = NS()
+
+bpy = types.ModuleType("bpy")
+bpy.props = props
+bpy.types = types_module
+bpy.utils = utils
+bpy.path = path
+bpy.app = app
+bpy.ops = ops
+bpy.data = data
+bpy.context = context
+
+
+# io_scene_valvesource
+#################################################
+
+def shouldExportGroup(group):
+    return group.vs.export and not group.vs.mute
+
+def actionsForFilter(filter):
+    # scans every action, like Blender Source Tools does
+    filter = filter.lower()
+    return [action for action in bpy.data.actions if fnmatch.fnmatch(action.name.lower(), filter)]
+
+valvesource = types.ModuleType("io_scene_valvesource")
+valvesource.shouldExportGroup = shouldExportGroup
+valvesource.__path__ = []
+valvesource_utils = types.ModuleType("io_scene_valvesource.utils")
+valvesource_utils.actionsForFilter = actionsForFilter
+valvesource.utils = valvesource_utils
+
+
+def install():
+    """Puts the stand-ins in sys.modules, before the add-on is imported"""
+    for name, module in (
+        ("bpy", bpy), ("bpy.props", props), ("bpy.types", types_module),
+        ("bpy.utils", utils), ("bpy.path", path), ("bpy.app", app), ("bpy.ops", ops),
+        ("io_scene_valvesource", valvesource), ("io_scene_valvesource.utils", valvesource_utils),
+    ):
+        sys.modules[name] = module
+
+def load_addon():
+    """Imports the add-on as a package and registers it"""
+    if ADDON_NAME in sys.modules:
+        return sys.modules[ADDON_NAME]
+    spec = importlib.util.spec_from_file_location(
+        ADDON_NAME, os.path.join(ADDON_DIR, "__init__.py"), submodule_search_locations=[ADDON_DIR])
+    addon = importlib.util.module_from_spec(spec)
+    sys.modules[ADDON_NAME] = addon
+    spec.loader.exec_module(addon)
+    addon.register()
+    return addon
+
+
+# Synthetic scenes
+#################################################
+
+@dataclass
+class SceneSpec:
+    collections: int = 4            # exported collections
+    objects_per_collection: int = 8
+    objects: int = 4                # exported loose objects
+    bones: int = 64
+    actions: int = 32
+    armatures: int = 1              # armatures exporting actions
+    images: int = 32
+    materials: int = 32
+    mesh_verts: int = 256           # vertices of each mesh object (they share one mesh)
+    collision_pieces: int = 8       # cubes in the collision model's mesh
+    generated_images: int = 1       # 512x512 float images without a file, exported to TGA
+
+    def scaled(self, factor):
+        return SceneSpec(**{k: max(1, int(v * factor)) for k, v in self.__dict__.items()})
+
+
+def make_socket(name, from_node=None, default_value=1.0):
+    links = [NS(from_node=from_node)] if from_node else []
+    return NS(name=name, is_linked=bool(links), links=links, default_value=default_value)
+
+def make_node(type, inputs=(), **kwargs):
+    return NS(type=type, inputs=PropCollection(inputs), **kwargs)
+
+def make_material(name, base, normal=None):
+    tex = make_node('TEX_IMAGE', image=base)
+    inputs = [make_socket('Base Color', tex), make_socket('Alpha'), make_socket('Emission Color'),
+              make_socket('Emission Strength', default_value=0.0)]
+    if normal:
+        normal_map = make_node('NORMAL_MAP', [make_socket('Color', make_node('TEX_IMAGE', image=normal))])
+        inputs.append(make_socket('Normal', normal_map))
+    else:
+        inputs.append(make_socket('Normal'))
+    bsdf = make_node('BSDF_PRINCIPLED', inputs)
+    output = make_node('OUTPUT_MATERIAL', [make_socket('Surface', bsdf)], is_active_output=True)
+    return Material(name, use_nodes=True, node_tree=NS(nodes=[output, bsdf, tex]), blend_method='OPAQUE')
+
+def make_mesh(co, faces):
+    """Mesh with foreach_get() arrays for vertices (co), quads (faces), and
+    the edges and loops between them"""
+    import numpy as np
+    co = np.asarray(co, dtype=np.float32)
+    faces = np.asarray(faces, dtype=np.int64)
+
+    # loop i's edge goes from its vertex to the next one of the face
+    pairs = np.stack([faces, np.roll(faces, -1, axis=1)], axis=2).reshape(-1, 2)
+    pairs.sort(axis=1)
+    keys, loop_edges = np.unique(pairs[:, 0] * len(co) + pairs[:, 1], return_inverse=True)
+    edges = np.stack([keys // len(co), keys % len(co)], axis=1)
+
+    corners = co[faces]
+    normals = np.cross(corners[:, 2] - corners[:, 0], corners[:, 3] - corners[:, 1])
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    return NS(
+        vertices=ArrayCollection(len(co), co=co),
+        edges=ArrayCollection(len(edges), vertices=edges),
+        loops=ArrayCollection(faces.size, vertex_index=faces, edge_index=loop_edges),
+        polygons=ArrayCollection(len(faces), normal=normals, center=corners.mean(axis=1),
+                                 loop_total=np.full(len(faces), 4)),
+    )
+
+def grid_mesh(verts):
+    """A flat grid of about that many vertices"""
+    import numpy as np
+    n = max(2, int(verts ** 0.5))
+    x, y = np.meshgrid(np.arange(n), np.arange(n), indexing='ij')
+    co = np.stack([x.ravel(), y.ravel(), np.zeros(n * n)], axis=1)
+    i = (np.arange(n - 1)[:, None] * n + np.arange(n - 1)[None, :]).ravel()
+    return make_mesh(co, np.stack([i, i + n, i + n + 1, i + 1], axis=1))
+
+CUBE_CO = [(i & 1, i >> 1 & 1, i >> 2 & 1) for i in range(8)]
+CUBE_FACES = [(0, 2, 3, 1), (4, 5, 7, 6), (0, 1, 5, 4), (2, 6, 7, 3), (0, 4, 6, 2), (1, 3, 7, 5)]
+
+def cubes_mesh(count):
+    """count separate cubes, like a collision model made of convex pieces"""
+    import numpy as np
+    offsets = np.arange(count)[:, None, None]
+    co = (np.array(CUBE_CO)[None] + offsets * np.array([2, 0, 0])).reshape(-1, 3)
+    faces = (np.array(CUBE_FACES)[None] + offsets * 8).reshape(-1, 4)
+    return make_mesh(co, faces)
+
+def generated_image(name, size=512):
+    import numpy as np
+    pixels = np.random.default_rng(len(name)).random(size * size * 4, dtype=np.float32)
+    return Image(name, filepath="", type='UV_TEST', source='GENERATED', size=(size, size),
+                 is_float=True, colorspace_settings=NS(name='Linear Rec.709'), pixels=PixelArray(pixels))
+
+def object_vs(**kwargs):
+    return NS(export=True, mute=False, subdir='', action_filter='*', **kwargs)
+
+def make_scene(spec, root=None):
+    """A scene with spec's counts of everything, its .blend under
+    <root>/content/hl2mod/models/props/bench/bench.blend"""
+    global data
+    root = root or os.path.join(os.path.abspath(os.sep), "tmp", "qcgen_bench")
+    data = bpy.data = new_data()
+    data.filepath = os.path.join(root, "content", "hl2mod", "models", "props", "bench", "bench.blend")
+
+    images = [Image("tex_{:04d}".format(i), filepath="//textures/tex_{:04d}.png".format(i), type='IMAGE',
+                    size=(64, 64)) for i in range(spec.images)]
+    data.images.extend(images)
+    try:
+        data.images.extend(generated_image("generated_{:04d}".format(i)) for i in range(spec.generated_images))
+    except ImportError:  # NumPy
+        pass
+    materials = [make_material("mat_{:04d}".format(i), images[i % len(images)],
+                               images[(i + 1) % len(images)] if i % 2 else None)
+                 for i in range(spec.materials)]
+    data.materials.extend(materials)
+    data.actions.extend(Action("anim_{:04d}".format(i)) for i in range(spec.actions))
+
+    try:
+        mesh, collision_mesh = grid_mesh(spec.mesh_verts), cubes_mesh(spec.collision_pieces)
+    except ImportError:  # NumPy
+        mesh = collision_mesh = None
+
+    def mesh_object(name, parent=None, mesh=mesh):
+        ob = Object(name, type='MESH', parent=parent, vs=object_vs(), data=mesh,
+                    material_slots=[NS(material=materials[hash(name) % len(materials)])])
+        data.objects.append(ob)
+        return ob
+
+    bones = [NS(name="bone_{:04d}".format(i), bone=NS(use_deform=i % 3 != 0, collections=[]))
+             for i in range(spec.bones)]
+    armatures = []
+    for i in range(spec.armatures):
+        arm_data = NS(vs=NS(action_selection='FILTERED'),
+                      bones=ArrayCollection(len(bones), use_deform=[b.bone.use_deform for b in bones]))
+        arm = Object("armature_{}".format(i), type='ARMATURE', parent=None, vs=object_vs(),
+                     data=arm_data, pose=None, animation_data=None, material_slots=[])
+        arm.pose = NS(bones=bones, id_data=arm)
+        armatures.append(arm)
+        data.objects.append(arm)
+
+    export_list = []
+    names = ["ref"] + ["lod{}".format(i + 1) for i in range(2)] + ["phys"]
+    for i in range(spec.collections):
+        name = names[i] if i < len(names) else "part_{}".format(i)
+        objects = [mesh_object("{}_{}".format(name, j), armatures[0] if armatures else None,
+                               collision_mesh if name == "phys" else mesh)
+                   for j in range(spec.objects_per_collection)]
+        coll = Collection(name, all_objects=objects, children=[], vs=object_vs())
+        data.collections.append(coll)
+        export_list.append(NS(name=name, ob_type='COLLECTION', obj=None, collection=coll))
+    for i in range(spec.objects):
+        ob = mesh_object("loose_{}".format(i))
+        export_list.append(NS(name=ob.name, ob_type='OBJECT', obj=ob, collection=None))
+    for arm in armatures:
+        export_list.append(NS(name=arm.name, ob_type='ACTION', obj=arm, collection=None))
+
+    scene = Scene("Scene")
+    scene.collection = Collection("Scene Collection", all_objects=list(data.objects),
+                                  children=list(data.collections), vs=object_vs())
+    scene.vs = NS(export_list=export_list, export_format='SMD', export_path="//",
+                  engine_path=os.path.join(root, "game", "bin"),
+                  game_path=os.path.join(root, "game", "hl2mod"), qc_path="//*.qc")
+    scene.qcgen.cdmaterials = "models/props/bench"
+    scene.qcgen.modelname = "props/bench/bench.mdl"
+    if spec.collections > 3:
+        scene.qcgen.collisionmodel = data.collections[3]
+        scene.qcgen.use_collisionjoints = True
+
+    context.__dict__.clear()
+    context.__dict__.update(
+        scene=scene, window=None, screen=NS(areas=[]), selected_objects=[],
+        evaluated_depsgraph_get=lambda: None,
+        window_manager=NS(windows=[]), preferences=NS(addons={}),
+    )
+    return context
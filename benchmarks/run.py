@@ -0,0 +1,303 @@
+"""Times the add-on's hot paths on synthetic scenes, without Blender.
+
+bpy and Blender Source Tools are replaced by the stand-ins in fakebpy.py,
+so this runs on any Python 3.8+:
+
+    python benchmarks/run.py                      # scales 1 and 4
+    python benchmarks/run.py -s 1 10 100 -n 3 --only qc_from_vs
+    python benchmarks/run.py --json results.json --compare baseline.json
+
+Each scale multiplies the counts of the base scene (export items,
+collections, bones, actions, images, materials, see fakebpy.SceneSpec).
+Reports the median and best time of each path and its peak Python memory
+(tracemalloc, measured in a separate run). With --compare, exits with 1 if
+a path got slower than --threshold times its time in the baseline.
+
+The VTF and QC compile benchmarks run shell scripts in place of vtex.exe
+and studiomdl.exe, they're skipped where there's no /bin/sh.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import struct
+import argparse
+import contextlib
+import platform
+import tempfile
+import statistics
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fakebpy
+
+VTEX_STUB = """#!/bin/sh
+# copies stub.vtf from its own folder to <outdir>/<source name>.vtf
+out=.
+src=
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -outdir) out="$2"; shift ;;
+        -game) shift ;;
+        -*) ;;
+        *) src="$1" ;;
+    esac
+    shift
+done
+name=$(basename "$src")
+mkdir -p "$out"
+cp "$(dirname "$0")/stub.vtf" "$out/${name%.*}.vtf"
+echo "vtex: $src"
+"""
+
+STUDIOMDL_STUB = """#!/bin/sh
+# prints what studiomdl would, fails on QCs containing $fail
+for qc; do :; done
+echo "qdir:    $(dirname "$qc")"
+if grep -n '\\$fail' "$qc" | head -n 1 | sed "s|^\\([0-9]*\\):.*|ERROR: $qc(\\1): - bad command \\$fail|" | grep .; then
+    exit 1
+fi
+echo "Completed \\"$(basename "$qc")\\""
+"""
+
+
+class Benchmark:
+    def __init__(self, name, run, setup=None, needs_sh=False, needs_numpy=False):
+        self.name = name
+        self.run = run          # run(context)
+        self.setup = setup      # setup(context), not timed, before every run
+        self.needs_sh = needs_sh
+        self.needs_numpy = needs_numpy
+
+
+def write_stub(path, script):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(script)
+    os.chmod(path, 0o755)
+
+def stub_vtf():
+    """A valid 4x4 DXT1 VTF with 3 mips and a 4x4 thumbnail, all black"""
+    header = struct.pack('<4sIIIHHIHH4x3f4xfIBiBBH', b'VTF\0', 7, 2, 80, 4, 4, 0, 1, 0,
+                         0.0, 0.0, 0.0, 1.0, 13, 3, 13, 4, 4, 1)
+    return header + bytes(80 - len(header)) + bytes(8 * 4)
+
+def make_files(context, spec):
+    """The TGAs of the scene's images, the vtex and studiomdl stubs and the VTF vtex copies"""
+    bpy = fakebpy.bpy
+    for img in bpy.data.images:
+        if not img.filepath:
+            continue    # generated, its TGA is exported when it's compiled
+        path = os.path.splitext(bpy.path.abspath(img.filepath))[0] + ".tga"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'wb').close()
+
+    write_stub(os.path.join(context.scene.vs.engine_path, "vtex.exe"), VTEX_STUB)
+    with open(os.path.join(context.scene.vs.engine_path, "stub.vtf"), 'wb') as f:
+        f.write(stub_vtf())
+    write_stub(os.path.join(context.scene.vs.engine_path, "studiomdl.exe"), STUDIOMDL_STUB)
+    os.makedirs(os.path.dirname(bpy.data.filepath), exist_ok=True)
+
+
+def benchmarks(addon):
+    from qc_generator import qcfile, vmt_generator
+    bpy = fakebpy.bpy
+
+    def operator(cls, **props):
+        def run(context):
+            op = cls()
+            for key, value in props.items():
+                setattr(op, key, value)
+            result = op.execute(context)
+            errors = [msg for kind, msg in op.reports if 'ERROR' in kind]
+            if errors:
+                raise RuntimeError("{}: {}".format(cls.__name__, errors[0]))
+            return result
+        return run
+
+    def draw_panel(context):
+        panel = vmt_generator.VMT_PT_VMTSettings()
+        panel.draw(context)
+        return panel.layout.widgets
+
+    def clear_vmts(context):
+        mat_dir = vmt_generator.get_materials_dir(context)
+        shutil.rmtree(mat_dir, ignore_errors=True)
+
+    def clear_filter_cache(context):
+        vmt_generator.filter_cache.clear()
+
+    def forget_fingerprint(context):
+        context.scene.qcgen.qc_fingerprint = ""
+
+    def write_multi_qc(context):
+        context.scene.qcgen.multi_qc = True
+        try:
+            operator(addon.QC_OT_WriteQC)(context)
+        finally:
+            context.scene.qcgen.multi_qc = False
+
+    def preflight(context):
+        from qc_generator.preflight import preflight
+        scene = context.scene
+        return preflight(context, scene.qcgen, scene.vs.export_list, qcfile.ExportIndex(scene.vs.export_list))
+
+    def export_tgas(context):
+        from qc_generator.tga import export_image
+        for img in bpy.data.images:
+            if img.source == 'GENERATED':
+                export_image(img, vmt_generator.image_source_base(img) + ".tga")
+
+    generated_pixels = {}
+
+    def builtin_vtf(context):
+        from qc_generator.tga import image_pixels
+        from qc_generator.vtf import write_vtf
+        out_dir = vmt_generator.get_materials_dir(context)
+        for img in bpy.data.images:
+            if img.source == 'GENERATED':
+                if img.name not in generated_pixels:
+                    generated_pixels[img.name] = image_pixels(img)[::-1]
+                write_vtf(os.path.join(out_dir, vmt_generator.image_file_stem(img) + ".vtf"), generated_pixels[img.name])
+
+    def read_vtf_headers(context):
+        from qc_generator.vtf import read_header
+        out_dir = vmt_generator.get_materials_dir(context)
+        for entry in os.scandir(out_dir):
+            if entry.name.endswith(".vtf"):
+                read_header(entry.path)
+
+    def write_qc(context):
+        if not os.path.exists(addon.default_qc_path()):
+            operator(addon.QC_OT_WriteQC)(context)
+
+    first_image = lambda: bpy.data.images[0].name
+    first_material = lambda: bpy.data.materials[0].name
+
+    return [
+        Benchmark("qc_from_vs", lambda context: qcfile.qc_from_vs(context)),
+        Benchmark("qc_fingerprint", lambda context: qcfile.qc_fingerprint(context)),
+        Benchmark("WriteQC", operator(addon.QC_OT_WriteQC), setup=forget_fingerprint),
+        Benchmark("WriteQC (unchanged)", operator(addon.QC_OT_WriteQC)),
+        Benchmark("WriteQC (one per collection)", write_multi_qc),
+        Benchmark("preflight", preflight, needs_numpy=True),
+        Benchmark("AutofillVS", operator(addon.QC_OT_AutofillVS)),
+        Benchmark("VMTSettings.draw", draw_panel, setup=clear_filter_cache),
+        Benchmark("VMTSettings.draw (cached)", draw_panel),
+        Benchmark("MakeVMT", lambda context: operator(vmt_generator.VMT_OT_MakeVMT, mat_name=first_material())(context),
+                  setup=clear_vmts),
+        Benchmark("MakeAllVMT", operator(vmt_generator.VMT_OT_MakeAllVMT), setup=clear_vmts),
+        Benchmark("MakeVTF", lambda context: operator(vmt_generator.VMT_OT_MakeVTF, img_name=first_image(), force=True)(context),
+                  needs_sh=True),
+        Benchmark("MakeAllVTF", operator(vmt_generator.VMT_OT_MakeAllVTF, force=True), needs_sh=True),
+        Benchmark("MakeAllVTF (up to date)", operator(vmt_generator.VMT_OT_MakeAllVTF), needs_sh=True),
+        Benchmark("export TGA", export_tgas, needs_numpy=True),
+        Benchmark("write_vtf (DXT5)", builtin_vtf, needs_numpy=True),
+        Benchmark("read VTF headers", read_vtf_headers, needs_numpy=True),
+        Benchmark("CompileQC", operator(addon.QC_OT_CompileQC), setup=write_qc, needs_sh=True),
+    ]
+
+
+def measure(bench, context, repeat):
+    # the operators print their summaries
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return _measure(bench, context, repeat)
+
+def _measure(bench, context, repeat):
+    times = []
+    for _ in range(repeat):
+        if bench.setup:
+            bench.setup(context)
+        start = time.perf_counter()
+        bench.run(context)
+        times.append(time.perf_counter() - start)
+
+    if bench.setup:
+        bench.setup(context)
+    tracemalloc.start()
+    try:
+        bench.run(context)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {'median_s': statistics.median(times), 'min_s': min(times), 'peak_bytes': peak}
+
+
+def compare(results, baseline, threshold):
+    """Results more than threshold times slower than the baseline"""
+    old = {(r['benchmark'], r['scale']): r for r in baseline['results']}
+    slower = []
+    for r in results:
+        b = old.get((r['benchmark'], r['scale']))
+        if b and r['median_s'] > b['median_s'] * threshold:
+            slower.append((r, b))
+    return slower
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="run.py", description="Benchmark the add-on on synthetic scenes.")
+    parser.add_argument("-s", "--scales", type=float, nargs="+", default=[1, 4], help="scene size multipliers")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument("--only", help="comma separated benchmark names")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results of an earlier --json run to compare with")
+    parser.add_argument("--threshold", type=float, default=1.5, help="slowdown that counts as a regression")
+    parser.add_argument("--profile", action="store_true", help="enable the add-on's profiling, to measure its overhead")
+    args = parser.parse_args(argv)
+
+    fakebpy.install()
+    addon = fakebpy.load_addon()
+    suite = benchmarks(addon)
+    if args.only:
+        names = set(args.only.split(","))
+        suite = [b for b in suite if b.name in names]
+    if not shutil.which("sh"):
+        suite = [b for b in suite if not b.needs_sh]
+    try:
+        import numpy
+    except ImportError:
+        suite = [b for b in suite if not b.needs_numpy]
+
+    root = tempfile.mkdtemp(prefix="qcgen_bench_")
+    results = []
+    try:
+        for scale in args.scales:
+            spec = fakebpy.SceneSpec().scaled(scale)
+            context = fakebpy.make_scene(spec, os.path.join(root, str(scale)))
+            context.scene.qcgen.open_in_text_editor = False
+            context.scene.qcgen.preflight = False   # timed on its own
+            if args.profile:
+                prefs = fakebpy.NS(profile=True, profile_dir=os.path.join(root, str(scale)))
+                context.preferences.addons[fakebpy.ADDON_NAME] = fakebpy.NS(preferences=prefs)
+            make_files(context, spec)
+
+            print("\nscale {:g}: {}".format(scale, ", ".join("{} {}".format(v, k) for k, v in spec.__dict__.items())))
+            print("{:<32}{:>12}{:>12}{:>12}".format("", "median", "min", "peak mem"))
+            for bench in suite:
+                r = measure(bench, context, args.repeat)
+                print("{:<32}{:>10.3f}ms{:>10.3f}ms{:>9.1f}KiB".format(
+                    bench.name, r['median_s'] * 1000, r['min_s'] * 1000, r['peak_bytes'] / 1024))
+                r.update(benchmark=bench.name, scale=scale, counts=dict(spec.__dict__))
+                results.append(r)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': platform.python_version(), 'platform': platform.platform(),
+                       'repeat': args.repeat, 'results': results}, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(results, json.load(f), args.threshold)
+        for r, b in slower:
+            print("REGRESSION {} at scale {:g}: {:.3f}ms, was {:.3f}ms".format(
+                r['benchmark'], r['scale'], r['median_s'] * 1000, b['median_s'] * 1000))
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,160 @@
+import os
+import threading
+
+# Directory snapshot of the texture source folders and the VTF output folder.
+# Scans run on a background thread, lookups are plain dict reads, so panels
+# can show a texture's status without touching the disk.
+# Scans also read the headers of the VTFs that changed, see vtf.read_header().
+# The snapshot can be a few seconds old, it is only for drawing: operators
+# check the disk themselves.
+
+# statuses returned by TextureIndex.status()
+NO_SOURCE = 'NO_SOURCE'
+MISSING = 'MISSING'
+STALE = 'STALE'
+UP_TO_DATE = 'UP_TO_DATE'
+INVALID = 'INVALID'         # the VTF is there but its header is broken or it's truncated
+
+
+def vtf_name(src_path):
+    """Normcased name of the VTF compiled from a source"""
+    return os.path.normcase(os.path.splitext(os.path.basename(src_path))[0] + '.vtf')
+
+def normkey(path):
+    return os.path.normcase(os.path.normpath(path))
+
+def scan_dir(path):
+    """{normcased file name: (path, mtime_ns)} of the files in a directory"""
+    files = {}
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_file():
+                        files[os.path.normcase(entry.name)] = (entry.path, entry.stat().st_mtime_ns)
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    return files
+
+
+class TextureIndex:
+    def __init__(self, source_exts=('.tga', '.psd')):
+        self.source_exts = source_exts
+        self.dirs = {}          # normcased dir -> scan_dir() result
+        self.out_dir = None
+        self.vtfs = {}          # normcased VTF name in out_dir -> (mtime_ns, VTFInfo or None if broken)
+        self.generation = 0     # bumped after every scan
+        self._request = None
+        self._rescan = False    # set by refresh(), a running scan starts over when it's done
+        self._scanning = False
+        self._lock = threading.Lock()
+
+    def refresh(self, source_dirs, out_dir, force=False):
+        """Rescans in the background if the folders changed or force is set"""
+        request = (tuple(sorted(set(map(normkey, source_dirs)))), normkey(out_dir))
+        with self._lock:
+            if not force and request == self._request:
+                return
+            self._request = request
+            self._rescan = True
+            if self._scanning:
+                return
+            self._scanning = True
+        threading.Thread(target=self._scan, daemon=True).start()
+
+    def _scan(self):
+        while True:
+            with self._lock:
+                request = self._request
+                self._rescan = False
+
+            source_dirs, out_dir = request
+            dirs = {d: scan_dir(d) for d in set(source_dirs + (out_dir,))}
+            vtfs = self._read_vtfs(dirs[out_dir], self.vtfs if out_dir == self.out_dir else {})
+            self.dirs = dirs
+            self.vtfs = vtfs
+            self.out_dir = out_dir
+            self.generation += 1
+
+            with self._lock:
+                if not self._rescan:
+                    self._scanning = False
+                    return
+
+    @staticmethod
+    def _read_vtfs(files, old):
+        """vtfs for the files of the output folder, only reading the headers
+        of VTFs that are new or changed since the old scan"""
+        from .vtf import read_header
+        vtfs = {}
+        for name, (path, mtime) in files.items():
+            if not name.endswith('.vtf'):
+                continue
+            cached = old.get(name)
+            if cached and cached[0] == mtime:
+                vtfs[name] = cached
+                continue
+            try:
+                vtfs[name] = (mtime, read_header(path))
+            except (OSError, ValueError):
+                vtfs[name] = (mtime, None)
+        return vtfs
+
+    @property
+    def ready(self):
+        return self.generation > 0
+
+    def _lookup(self, path):
+        """(path, mtime_ns) of a file, False if its folder was scanned and it's
+        not there, or None if its folder hasn't been scanned"""
+        d, name = os.path.split(normkey(path))
+        files = self.dirs.get(d)
+        if files is None:
+            return None
+        return files.get(name, False)
+
+    def _scanned_source(self, img_base):
+        """(path, mtime_ns) of an image's TGA/PSD, False if it has none, or
+        None if its folder hasn't been scanned"""
+        for ext in self.source_exts:
+            found = self._lookup(img_base + ext)
+            if found is None or found:
+                return found
+        return False
+
+    def vtf_info(self, img_base):
+        """VTFInfo of an image's VTF as of the last scan, None if it has none or it's broken"""
+        source = self._scanned_source(img_base)
+        header = self.vtfs.get(vtf_name(source[0])) if source else None
+        return header and header[1]
+
+    def status(self, img_base):
+        """Status of the VTF for an image, or None if its folders haven't been scanned.
+        Never touches the disk."""
+        if self.out_dir is None:
+            return None
+
+        source = self._scanned_source(img_base)
+        if source is None:
+            return None
+        if not source:
+            return NO_SOURCE
+
+        name = vtf_name(source[0])
+        vtf = self.dirs.get(self.out_dir, {}).get(name)
+        if not vtf:
+            return MISSING
+        header = self.vtfs.get(name)
+        if header and header[1] is None:
+            return INVALID
+
+        newest = source[1]
+        settings = self._lookup(os.path.splitext(source[0])[0] + '.txt')
+        if settings:
+            newest = max(newest, settings[1])
+        return STALE if vtf[1] < newest else UP_TO_DATE
+
+
+texture_index = TextureIndex()
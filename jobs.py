@@ -0,0 +1,173 @@
+import os
+import time
+import queue
+import threading
+import subprocess
+
+# Child processes that can be polled from Blender's main thread (e.g. from a
+# modal operator's timer) without ever blocking on their output.
+
+
+class ProcessJob:
+    def __init__(self, name, args, cwd=None):
+        self.name = name
+        self.args = args
+        self.cwd = cwd
+        self.process = None
+        self.returncode = None
+        self.cancelled = False
+        self.start_time = None
+        self.end_time = None
+        self.log = []
+
+        self._lines = queue.Queue()
+        self._reader = None
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        try:
+            self.process = subprocess.Popen(
+                self.args, cwd=self.cwd,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+        except OSError as e:
+            self._lines.put(str(e))
+            self.returncode = -1
+            self.end_time = self.start_time
+            return
+
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        for raw in iter(self.process.stdout.readline, b''):
+            self._lines.put(raw.decode('utf8', errors='replace').rstrip('\r\n'))
+        self.process.stdout.close()
+
+    def read_lines(self):
+        """Returns the output lines that arrived since the last call"""
+        lines = []
+        while True:
+            try:
+                lines.append(self._lines.get_nowait())
+            except queue.Empty:
+                break
+        self.log.extend(lines)
+        return lines
+
+    def poll(self):
+        """True once the process exited and all of its output was read"""
+        if self.returncode is not None:
+            return True
+        if self.process is None or self.process.poll() is None:
+            return False
+        if self._reader and self._reader.is_alive():
+            return False
+        self.returncode = self.process.returncode
+        self.end_time = time.perf_counter()
+        return True
+
+    def cancel(self):
+        self.cancelled = True
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+
+    @property
+    def started(self):
+        return self.start_time is not None
+
+    @property
+    def succeeded(self):
+        return self.returncode == 0 and not self.cancelled
+
+    @property
+    def elapsed(self):
+        if self.start_time is None:
+            return 0.0
+        return (self.end_time or time.perf_counter()) - self.start_time
+
+
+class ThreadJob(ProcessJob):
+    """Runs function(job) on a thread instead of a child process, polled the
+    same way. The function logs with job.print() and fails by raising, args
+    only describe the job (like a command line, e.g. for the VTF manifest)."""
+
+    def __init__(self, name, function, args=()):
+        super().__init__(name, list(args))
+        self.function = function
+        self._thread = None
+        self._result = None
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.function(self)
+            self._result = 0
+        except Exception as e:
+            self.print("ERROR: {}".format(e))
+            self._result = 1
+
+    def print(self, line):
+        self._lines.put(line)
+
+    def poll(self):
+        if self.returncode is not None:
+            return True
+        if self._thread is None or self._thread.is_alive():
+            return False
+        self.returncode = self._result
+        self.end_time = time.perf_counter()
+        return True
+
+    def cancel(self):
+        # a thread can't be stopped, it finishes and its result is ignored
+        self.cancelled = True
+
+
+class JobQueue:
+    """Runs jobs with at most max_running of them alive at once"""
+
+    def __init__(self, jobs, max_running=None):
+        self.pending = list(jobs)
+        self.running = []
+        self.finished = []
+        self.max_running = max(1, max_running or os.cpu_count() or 1)
+        self.total = len(self.pending)
+
+    def update(self):
+        """Reaps finished jobs and starts pending ones.
+        Returns the jobs that finished during this call."""
+        done = [job for job in self.running if job.poll()]
+        for job in done:
+            self.running.remove(job)
+            self.finished.append(job)
+
+        while self.pending and len(self.running) < self.max_running:
+            job = self.pending.pop(0)
+            job.start()
+            self.running.append(job)
+
+        return done
+
+    def cancel(self):
+        for job in self.running:
+            job.cancel()
+        for job in self.pending:
+            job.cancelled = True
+        self.finished.extend(self.pending)
+        self.pending = []
+
+    def wait(self, interval=0.05):
+        while not self.done:
+            for job in self.update():
+                job.read_lines()
+            for job in self.running:
+                job.read_lines()
+            time.sleep(interval)
+
+    @property
+    def done(self):
+        return not self.pending and not self.running
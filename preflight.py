@@ -0,0 +1,175 @@
+import numpy as np
+
+from .qcfile import classify_export_items, get_pose
+
+# Checks the meshes of the model against studiomdl's limits before the QC is
+# written, so problems show up without an export and compile round trip.
+
+MAX_VERTS = 65536           # MAXSTUDIOVERTS, per body
+MAX_BONES = 128             # MAXSTUDIOBONES
+MAX_CONVEX_PIECES = 20      # studiomdl's default, $maxconvexpieces raises it
+
+
+class MeshArrays:
+    """The parts of a mesh the checks need, as arrays"""
+
+    def __init__(self, mesh):
+        self.vertex_count = len(mesh.vertices)
+        self.edges = read(mesh.edges, "vertices", np.int32, 2)
+        self.loop_edges = read(mesh.loops, "edge_index", np.int32)
+        self.normals = read(mesh.polygons, "normal", np.float32, 3)
+        self.centers = read(mesh.polygons, "center", np.float32, 3)
+        self.loop_totals = read(mesh.polygons, "loop_total", np.int32)
+        self.co = read(mesh.vertices, "co", np.float32, 3)
+
+def read(collection, attr, dtype, width=1):
+    data = np.empty(len(collection) * width, dtype=dtype)
+    collection.foreach_get(attr, data)
+    return data.reshape(-1, width) if width > 1 else data
+
+
+def connected_components(vertex_count, edges):
+    """(labels, count): the connected piece of each vertex, numbered from 0,
+    -1 for vertices without edges"""
+    labels = np.arange(vertex_count)
+    if len(edges):
+        a, b = edges[:, 0], edges[:, 1]
+        while True:
+            # hook the root of each edge's higher piece onto the lower one...
+            ra, rb = labels[a], labels[b]
+            differ = ra != rb
+            if not differ.any():
+                break
+            ra, rb = ra[differ], rb[differ]
+            low = np.minimum(ra, rb)
+            np.minimum.at(labels, ra, low)
+            np.minimum.at(labels, rb, low)
+            # ...then point every vertex straight at its root
+            while True:
+                jumped = labels[labels]
+                if np.array_equal(jumped, labels):
+                    break
+                labels = jumped
+
+    used = np.zeros(vertex_count, dtype=bool)
+    used[edges.ravel()] = True
+    roots, pieces = np.unique(labels[used], return_inverse=True)
+    labels = np.full(vertex_count, -1)
+    labels[used] = pieces
+    return labels, len(roots)
+
+def concave_pieces(mesh, labels, tolerance=1e-4):
+    """Labels of the pieces with a concave edge: an edge whose two faces
+    see each other's centers in front of their planes"""
+    if not len(mesh.loop_edges):
+        return np.empty(0, dtype=labels.dtype)
+
+    edge_count = len(mesh.edges)
+    loop_faces = np.repeat(np.arange(len(mesh.loop_totals), dtype=np.int32), mesh.loop_totals)
+
+    # an edge shared by exactly two faces has them as its lowest and highest face
+    counts = np.bincount(mesh.loop_edges, minlength=edge_count)
+    f1 = np.full(edge_count, len(mesh.loop_totals), dtype=np.int32)
+    f2 = np.full(edge_count, -1, dtype=np.int32)
+    np.minimum.at(f1, mesh.loop_edges, loop_faces)
+    np.maximum.at(f2, mesh.loop_edges, loop_faces)
+    shared = np.flatnonzero(counts == 2)
+    f1, f2 = f1[shared], f2[shared]
+
+    size = np.ptp(mesh.co, axis=0).max() if len(mesh.co) else 1.0
+    d = np.einsum('ij,ij->i', mesh.normals[f1], mesh.centers[f2] - mesh.centers[f1])
+    concave_edges = shared[d > tolerance * size]
+    return np.unique(labels[mesh.edges[concave_edges, 0]])
+
+
+class PieceStats:
+    def __init__(self):
+        self.pieces = 0
+        self.concave = 0
+        self.max_verts = 0
+
+    def add(self, mesh):
+        labels, count = connected_components(mesh.vertex_count, mesh.edges)
+        if count:
+            self.max_verts = max(self.max_verts, int(np.bincount(labels[labels >= 0]).max()))
+        self.pieces += count
+        self.concave += len(concave_pieces(mesh, labels))
+
+
+def evaluated_meshes(context, item):
+    """The meshes of an export item with modifiers applied, only valid until the next one"""
+    objects = item.collection.all_objects if item.collection else [item.obj]
+    depsgraph = context.evaluated_depsgraph_get()
+    for ob in objects:
+        if ob.type != 'MESH':
+            continue
+        ob_eval = ob.evaluated_get(depsgraph)
+        mesh = ob_eval.to_mesh()
+        try:
+            yield mesh
+        finally:
+            ob_eval.to_mesh_clear()
+
+def item_armature(item):
+    objects = item.collection.all_objects if item.collection else [item.obj]
+    for ob in objects:
+        pose = get_pose(ob)
+        if pose is not None:
+            return pose.id_data
+    return None
+
+
+class PreflightReport:
+    def __init__(self):
+        self.body_verts = {}        # body name -> vertex count
+        self.bones = None           # (bones, deform bones) of the reference's armature
+        self.collision = None       # PieceStats
+        self.problems = []
+
+    def summary(self):
+        parts = ["{} {} verts".format(name, count) for name, count in self.body_verts.items()]
+        if self.bones:
+            parts.append("{} bones ({} deform)".format(*self.bones))
+        if self.collision:
+            c = self.collision
+            parts.append("collision {} pieces, {} concave, up to {} verts each".format(c.pieces, c.concave, c.max_verts))
+        return "Pre-flight: " + ", ".join(parts)
+
+
+def preflight(context, props, export_items, index):
+    """Checks the bodies and the collision model of a QC, see PreflightReport"""
+    report = PreflightReport()
+    # the QC only has a collision model if one is set, even if classify finds a "phys" item
+    physics = index.get(props.collisionmodel)
+    reference, bodies, lods, phys_item, sequences = classify_export_items(export_items, physics)
+
+    for item in ([reference] if reference else []) + bodies:
+        count = sum(len(mesh.vertices) for mesh in evaluated_meshes(context, item))
+        report.body_verts[item.name] = count
+        if count > MAX_VERTS:
+            report.problems.append("{} has {} vertices, studiomdl allows {} per body".format(item.name, count, MAX_VERTS))
+
+    arm = item_armature(reference) if reference else None
+    if arm is not None:
+        deform = np.empty(len(arm.data.bones), dtype=bool)
+        arm.data.bones.foreach_get("use_deform", deform)
+        report.bones = (len(deform), int(deform.sum()))
+        if len(deform) > MAX_BONES:
+            report.problems.append("{} has {} bones, studiomdl allows {}".format(arm.name, len(deform), MAX_BONES))
+
+    if physics is not None:
+        stats = report.collision = PieceStats()
+        for mesh in evaluated_meshes(context, physics):
+            stats.add(MeshArrays(mesh))
+
+        concave_cmd = "$concaveperjoint" if props.use_collisionjoints else "$concave"
+        if stats.pieces > 1 and not props.concave:
+            report.problems.append("The collision model has {} pieces but Concave is off, studiomdl will wrap {} in one convex hull".format(
+                stats.pieces, "the pieces of each joint" if props.use_collisionjoints else "them"))
+        if stats.concave:
+            report.problems.append("{} collision pieces aren't convex, studiomdl will wrap each in a convex hull".format(stats.concave))
+        if props.concave and stats.pieces > MAX_CONVEX_PIECES:
+            report.problems.append("The collision model has {} pieces, {} allows {} without $maxconvexpieces".format(
+                stats.pieces, concave_cmd, MAX_CONVEX_PIECES))
+
+    return report
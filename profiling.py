@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+# Phase timings for the operators, enabled in the add-on preferences.
+# Spans nest; the result is written as a Chrome trace (open it in
+# chrome://tracing or https://ui.perfetto.dev) and summarized in one line
+# for the operator's report.
+
+JOB_LANE_BASE = 1000    # trace thread ids of the job lanes
+
+
+class Profiler:
+    enabled = True
+
+    def __init__(self, name):
+        self.name = name
+        self.origin = time.perf_counter()
+        # [name, start, duration, thread id, parent index or None, args]
+        self.spans = []
+        self._stack = []
+        self._job_lanes = []    # end time of the last job on each lane
+
+    @contextmanager
+    def span(self, name, **args):
+        index = len(self.spans)
+        parent = self._stack[-1] if self._stack else None
+        self.spans.append([name, time.perf_counter(), 0.0, threading.get_ident(), parent, args])
+        self._stack.append(index)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            span = self.spans[index]
+            span[2] = time.perf_counter() - span[1]
+
+    def add_job(self, name, start, end, **args):
+        """A span timed elsewhere (a child process), on the first job lane
+        that's free at its start so overlapping jobs don't share one"""
+        for lane, lane_end in enumerate(self._job_lanes):
+            if lane_end <= start:
+                break
+        else:
+            lane = len(self._job_lanes)
+            self._job_lanes.append(0.0)
+        self._job_lanes[lane] = end
+        self.spans.append([name, start, end - start, JOB_LANE_BASE + lane, None, args])
+
+    def self_times(self):
+        """{span name: total time minus the time of nested spans}"""
+        times = {}
+        for name, start, duration, tid, parent, args in self.spans:
+            times[name] = times.get(name, 0.0) + duration
+            if parent is not None:
+                parent_name = self.spans[parent][0]
+                times[parent_name] = times.get(parent_name, 0.0) - duration
+        return times
+
+    def summary(self, top=4):
+        """The slowest phases, e.g. "bone followers 41.2ms, fingerprint 3.0ms, ..." """
+        times = sorted(self.self_times().items(), key=lambda kv: kv[1], reverse=True)
+        total = time.perf_counter() - self.origin
+        phases = ", ".join("{} {:.1f}ms".format(name, t * 1000) for name, t in times[:top])
+        return "{} {:.1f}ms: {}".format(self.name, total * 1000, phases)
+
+    def trace_events(self):
+        pid = os.getpid()
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': self.name}}]
+        events.extend({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': JOB_LANE_BASE + lane,
+                       'args': {'name': "jobs {}".format(lane + 1)}} for lane in range(len(self._job_lanes)))
+        for name, start, duration, tid, parent, args in self.spans:
+            events.append({
+                'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                'ts': (start - self.origin) * 1e6, 'dur': duration * 1e6, 'args': args,
+            })
+        return events
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf8') as f:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, f)
+
+
+class NullProfiler:
+    """Stands in for a Profiler when profiling is off"""
+    enabled = False
+    name = None
+    _span = nullcontext()
+
+    def span(self, name, **args):
+        return self._span
+
+    def add_job(self, name, start, end, **args):
+        pass
+
+    def summary(self, top=4):
+        return ""
+
+    def write(self, path):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
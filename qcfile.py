@@ -1,48 +1,175 @@
 
 import os
+import re
+import hashlib
 import bpy
 import bpy.ops
 from bpy.props import *
 
 from . import QC_Properties
+from .qcwriter import QCWriter
+from .profiling import NULL_PROFILER
 
+# part of the QC fingerprint, bump it when qc_from_vs writes something different
+# for the same inputs so existing QCs are regenerated
+QC_GENERATOR_VERSION = 2
 
-# uses data from io_scene_valvesource
-def qc_from_vs(context):
 
-    qctxt = ''
-    indent_level = 0
+class ExportIndex:
+    """Maps objects and collections to the export_list item that exports them.
+    Built in a single pass, the first item in the export list wins."""
+
+    def __init__(self, export_list):
+        self.items = {}
+        for item in export_list:
+            if item.obj:
+                self.items.setdefault(item.obj, item)
+            elif item.collection:
+                self.items.setdefault(item.collection, item)
+                for ob in item.collection.all_objects:
+                    self.items.setdefault(ob, item)
+
+    def get(self, obj):
+        return self.items.get(obj) if obj else None
+
+
+# QC_Properties values that are written as $directives: (key, default, emitter)
+# tuples where emitter(value) returns the line to write or None.
+# Compiled once from the class annotations by compile_qc_directives(), on the
+# first generation so that enabling the add-on doesn't import this module.
+qc_directives = []
+
+NO_DEFAULT = object()
+
+def property_info(annotation):
+    """(property function, keywords) of a class annotation, either
+    the old (function, keywords) tuple or a bpy.props._PropertyDeferred"""
+    if isinstance(annotation, tuple):
+        return annotation
+    return annotation.function, annotation.keywords
+
+def make_emitter(key, function):
+    if function == BoolProperty:  # bools to flags
+        flag = "$%s" % key
+        return lambda value: flag if value else None
+
+    # enum values are strings too, quoted like the string properties
+    if function in (StringProperty, EnumProperty):
+        fmt = '$%s "%%s"' % key
+        if key == 'modelname':
+            def emit_modelname(value):
+                if not value:  # discard empty strings
+                    return None
+                # Remove models/ from $modelname
+                if value.startswith('models/') or value.startswith('models\\'):
+                    value = value[7:]
+                return fmt % value
+            return emit_modelname
+        return lambda value: fmt % value if value else None
+
+    fmt = '$%s %%s' % key
+    return lambda value: fmt % (value,)
+
+def compile_qc_directives():
+    directives = []
+    for key, annotation in QC_Properties.__annotations__.items():
+        function, keywords = property_info(annotation)
+
+        if 'HIDDEN' in keywords.get('options', ()):
+            continue
+
+        # skip collections for now
+        if function == CollectionProperty:
+            continue
+
+        directives.append((key, keywords.get('default', NO_DEFAULT), make_emitter(key, function)))
+
+    qc_directives[:] = directives
+
+def emit_qc_directives(props, qcln):
+    if not qc_directives:
+        compile_qc_directives()
+
+    for key, default, emit in qc_directives:
+        value = getattr(props, key)
+        if value == default:  # skip default values
+            continue
+        line = emit(value)
+        if line is not None:
+            qcln(line)
 
-    def qcln(s='', indent=None):
-        indent = indent or indent_level
-        nonlocal qctxt
-        qctxt += ('\t' * indent_level) + s + '\n'
 
-    def qc_block_begin():
-        nonlocal indent_level
-        qcln('{')
-        indent_level += 1
+class ActionCache:
+    """Actions exported for each armature, with every distinct
+    action filter resolved only once per generation."""
 
-    def qc_block_end():
-        nonlocal indent_level
-        indent_level -= 1
-        qcln('}')
+    def __init__(self):
+        self.filtered = {}
 
+    def for_filter(self, action_filter):
+        actions = self.filtered.get(action_filter)
+        if actions is None:
+            from io_scene_valvesource.utils import actionsForFilter
+            actions = self.filtered[action_filter] = list(actionsForFilter(action_filter))
+        return actions
 
-    from io_scene_valvesource.utils import actionsForFilter
+    def for_object(self, obj):
+        if obj.data.vs.action_selection == 'FILTERED':
+            return self.for_filter(obj.vs.action_filter)
+        # 'CURRENT'
+        if obj.animation_data and obj.animation_data.action:
+            return [obj.animation_data.action]
+        return []
 
+
+# Export list
+#################################################
+
+# lodN in an export item's name, the reference is lod0
+LOD_NAME = re.compile(r'lod(\d+)', re.I)
+LOD_SUFFIX = re.compile(r'[\s_.-]*lod\d+', re.I)
+
+def lod_level(name):
+    """N of a lodN name, or None"""
+    m = LOD_NAME.search(name)
+    return int(m.group(1)) if m else None
+
+def lod_base_name(name):
+    """The name without its lodN: head_lod2 -> head"""
+    return LOD_SUFFIX.sub('', name)
+
+PHYS_SUFFIX = re.compile(r'[\s_.-]*phys\w*', re.I)
+
+def model_key(name):
+    """The part of a name that ties LODs and collision models to their model:
+    head_lod1, head_phys -> head, lod1 and phys -> "" """
+    return PHYS_SUFFIX.sub('', lod_base_name(name)).lower()
+
+def lod_name(name, level):
+    """The name of a model's LOD: ref -> ref_lod2, lod0 -> lod2"""
+    if LOD_NAME.search(name):
+        return LOD_NAME.sub(lambda m: m.group(0)[:3] + str(level), name, count=1)
+    return "{}_lod{}".format(name, level)
+
+def classify_export_items(export_items, body_physics=None):
+    """Sorts export items into (reference, bodies, lods, physics, sequences),
+    lods maps each level >= 1 to its items"""
     bodies = []
+    lods = {}
     body_reference = None
-    body_physics = None # TODO: This should be set by collision model in the settings
-
     sequences = []
 
-    for item in context.scene.vs.export_list:
+    for item in export_items:
             #layout.label(text="{item_name} {ob_type}".format(**item))
             lower = item.name.lower()
             if item.ob_type in ['COLLECTION', 'OBJECT']:
-                if (not body_physics) and 'phys' in lower:
+                level = lod_level(lower)
+                if item == body_physics:
+                    continue
+                elif (not body_physics) and 'phys' in lower:
                     body_physics = item
+                elif level:
+                    lods.setdefault(level, []).append(item)
                 elif (not body_reference) and ('ref' in lower or 'lod0' in lower):
                     body_reference = item
                 else:
@@ -63,93 +190,281 @@ def qc_from_vs(context):
             bodies.remove(body)
             break
 
-    qcln("// Auto-generated by Blender QC File Generator")
+    # LODs replace the reference, without one they're plain bodies
+    if not body_reference:
+        for level in sorted(lods):
+            bodies.extend(lods[level])
+        lods = {}
+
+    return body_reference, bodies, lods, body_physics, sequences
+
+
+# Multi-QC
+#################################################
+
+class ModelProps:
+    """The scene's QC_Properties with a model's overrides on top"""
+
+    def __init__(self, props, **overrides):
+        self._props = props
+        self.__dict__.update(overrides)
+
+    def __getattr__(self, name):
+        return getattr(self._props, name)
+
+def collection_tree(collection):
+    """A collection and all of the collections in it"""
+    tree = [collection]
+    for coll in tree:
+        tree.extend(coll.children)
+    return tree
+
+def qc_models(context, index=None):
+    """[(name, props, export items)] of the QCs written in multi-QC mode: one per
+    model in the Models list, or one per top-level collection if the list is empty.
+    Entries without a reference or body aren't models, their LODs and collision
+    models are moved to the model they belong to. The export list is walked once
+    for all of them."""
+    qcgen = context.scene.qcgen
+    export_list = context.scene.vs.export_list
+    index = index or ExportIndex(export_list)
+
+    if len(qcgen.models):
+        entries = [(m.collection, m.modelname, m.cdmaterials) for m in qcgen.models if m.collection]
+    else:
+        entries = [(coll, "", "") for coll in context.scene.collection.children]
+
+    # object or collection -> entry, the first entry wins
+    owner = {}
+    for i, (collection, modelname, cdmaterials) in enumerate(entries):
+        for coll in collection_tree(collection):
+            owner.setdefault(coll, i)
+        for ob in collection.all_objects:
+            owner.setdefault(ob, i)
+
+    items = [[] for entry in entries]
+    for item in export_list:
+        i = owner.get(item.obj or item.collection)
+        if i is not None:
+            items[i].append(item)
+
+    physics = index.get(qcgen.collisionmodel)
+
+    def is_body(item):
+        return (item.ob_type in ('COLLECTION', 'OBJECT') and item != physics
+            and not lod_level(item.name) and 'phys' not in item.name.lower())
+
+    # e.g. lod1, lod2 and phys collections next to ref, or the ref_lodN ones
+    # Create Missing LODs adds: matched by model_key(), else the first model
+    homes = [i for i, model_items in enumerate(items) if any(map(is_body, model_items))]
+    keys = {}
+    for i in homes:
+        keys.setdefault(model_key(entries[i][0].name), i)
+        for item in filter(is_body, items[i]):
+            keys.setdefault(model_key(item.name), i)
+    for i, model_items in enumerate(items):
+        if homes and i not in homes:
+            for item in model_items:
+                items[keys.get(model_key(item.name), homes[0])].append(item)
+
+    mdl_dir = os.path.dirname(qcgen.modelname)
+    models = []
+    for i in homes:
+        collection, modelname, cdmaterials = entries[i]
+        model_items = items[i]
+        overrides = {
+            'modelname': modelname or os.path.join(mdl_dir, collection.name + ".mdl"),
+            'cdmaterials': cdmaterials or qcgen.cdmaterials,
+        }
+        # the collision model only goes in the QC of the model it's part of
+        if physics is not None and physics not in model_items:
+            overrides['collisionmodel'] = None
+        models.append((collection.name, ModelProps(qcgen, **overrides), model_items))
+    return models
+
+
+def get_pose(obj):
+    if obj.type == 'ARMATURE':
+        return obj.pose
+    elif obj.parent and obj.parent.type == 'ARMATURE':
+        return obj.parent.pose
+    return None
+
+
+def bone_collection_names(bone):
+    # bone collections replaced bone groups in Blender 4.0
+    if hasattr(bone.bone, 'collections'):
+        return [coll.name for coll in bone.bone.collections]
+    group = getattr(bone, 'bone_group', None)
+    return [group.name] if group is not None else []
+
+def bone_in_collection(bone, name):
+    return name in bone_collection_names(bone)
+
+def filtered_bone_names(pose, props):
+    """Names of the pose bones that get attachments and bone followers,
+    after the deform/collection and include/exclude regex filters.
+    Raises re.error for an invalid regex."""
+    include = re.compile(props.bone_include) if props.bone_include else None
+    exclude = re.compile(props.bone_exclude) if props.bone_exclude else None
+    mode = props.bone_filter
+
+    names = []
+    for bone in pose.bones:
+        if mode == 'DEFORM' and not bone.bone.use_deform:
+            continue
+        if mode == 'COLLECTION' and not bone_in_collection(bone, props.bone_collection):
+            continue
+        if include and not include.search(bone.name):
+            continue
+        if exclude and exclude.search(bone.name):
+            continue
+        names.append(bone.name)
+    return names
 
-    props: QC_Properties = context.scene.qcgen
-    anots = QC_Properties.__annotations__
-    for key in anots:
-        if hasattr(props, key):
-            value = getattr(props, key)
-            value_type = anots[key].function
-            anot = anots[key].keywords
 
-            if 'options' in anot and 'HIDDEN' in anot['options']:
-                print("IGNORED: " + key)
-                continue
+# Hash of everything qc_from_vs reads: the export list, the QC properties,
+# the bones of the armatures being exported and the actions for each filter,
+# and the generator's version. If it didn't change, neither did the QC.
+def qc_fingerprint(context, index=None, actions=None):
+    from io_scene_valvesource import shouldExportGroup
 
-            # skip collections for now
-            if value_type == CollectionProperty:
-                continue
+    vs = context.scene.vs
+    props = context.scene.qcgen
+    index = index or ExportIndex(vs.export_list)
+    actions = actions or ActionCache()
 
-            # skip default values
-            if 'default' in anot and value == anot['default']:
-                print("SKIPPING: " + key)
-                continue
+    h = hashlib.sha1()
+    def add(*values):
+        h.update(repr(values).encode('utf8'))
 
-            if type(value) == bool and value == True:  # bools to flags
-                qcln("$%s" % key)
-                continue
+    add(QC_GENERATOR_VERSION, vs.export_format)
 
-            if type(value) == str and value == '':  # discard empty strings
-                continue
+    for key in QC_Properties.__annotations__:
+        if key in ('qc_text', 'qc_fingerprint'):
+            continue
+        value = getattr(props, key, None)
+        if isinstance(value, bpy.types.bpy_prop_collection):
+            value = [tuple(getattr(it, p.identifier) for p in it.bl_rna.properties if p.identifier != 'rna_type')
+                for it in value]
+        add(key, value)
+
+    physics = index.get(props.collisionmodel)
+    add(physics.name if physics else None)
+
+    for item in vs.export_list:
+        obj = item.obj or item.collection
+        should = shouldExportGroup(obj) if type(obj) == bpy.types.Collection else obj.vs.export
+        add(item.name, item.ob_type, obj.name, should, obj.vs.subdir)
+        if item.ob_type == 'ACTION' and item.obj:
+            add([a.name for a in actions.for_object(item.obj)])
+
+    armatures = set()
+    for ob in index.items:
+        pose = get_pose(ob) if isinstance(ob, bpy.types.Object) else None
+        if pose is not None:
+            armatures.add(pose.id_data)
+    for arm in sorted(armatures, key=lambda ob: ob.name):
+        # the bone filters read the deform flags and collections too
+        add(arm.name, [(bone.name, bone.bone.use_deform, bone_collection_names(bone)) for bone in arm.pose.bones])
+
+    return h.hexdigest()
+
+
+def qc_digest(text):
+    """Hash of a generated QC, to tell whether it was edited since"""
+    return hashlib.sha1(text.encode('utf8')).hexdigest()
+
+
+# uses data from io_scene_valvesource
+# lines are streamed to out (a list or anything with write(), see QCWriter),
+# if out is None the whole QC is returned as a string.
+# profiler times the phases (see profiling.py).
+# props and export_items default to the scene's, qc_models() gives them per model.
+def qc_from_vs(context, out=None, index=None, actions=None, profiler=NULL_PROFILER, props=None, export_items=None):
 
-            if type(value) == str:
-                if key == 'modelname':
-                    # Remove models/ from $modelname
-                    if value.startswith('models/') or value.startswith('models\\'):
-                        value = value[7:]
-                qcln('$%s "%s"' % (key, value))
-            else:
-                qcln('$%s %s' % (key, value))
+    writer = QCWriter(out)
+    qcln = writer.line
+    qc_block_begin = writer.block_begin
+    qc_block_end = writer.block_end
+
+
+    props: QC_Properties = props or context.scene.qcgen
+    index = index or ExportIndex(context.scene.vs.export_list)
+    if export_items is None:
+        export_items = context.scene.vs.export_list
+    actions = actions or ActionCache()
+
+    with profiler.span("collision lookup"):
+        body_physics = index.get(props.collisionmodel)
+
+    with profiler.span("classify export list"):
+        body_reference, bodies, lods, body_physics, sequences = classify_export_items(export_items, body_physics)
+
+    qcln("// Auto-generated by Blender QC File Generator")
+
+    with profiler.span("properties"):
+        emit_qc_directives(props, qcln)
 
     file_ext = '.' + (context.scene.vs.export_format.lower() or 'smd')
 
     from io_scene_valvesource import shouldExportGroup
 
-    # QC Command: $command "name" "path/file.ext"
-    # set name=False for nameless commands like $collisionmodel
-    def qc_item(item, cmd='body', subdir='', name=None, ext=file_ext):
-        
+    # "subdir/file.ext" of an export item, or None if it isn't exported
+    def item_file(item, subdir='', ext=file_ext):
+        if item is None: return None
+
         obj = item.obj or item.collection
 
         should = shouldExportGroup(obj) if type(obj) == bpy.types.Collection else obj.vs.export
-        if not should: return
+        if not should: return None
 
         if subdir == '' and obj.vs.subdir and obj.vs.subdir != '.':
             subdir = obj.vs.subdir + '/'
+        return subdir + obj.name + ext
+
+    # QC Command: $command "name" "path/file.ext"
+    # set name=False for nameless commands like $collisionmodel
+    def qc_item(item, cmd='body', subdir='', name=None, ext=file_ext):
+        path = item_file(item, subdir, ext)
+        if path is None: return
 
         if name == False:
-            qcln('${cmd} "{subdir}{o.name}{ext}"'.format(cmd=cmd, subdir=subdir, o=obj, ext=ext))
+            qcln('${cmd} "{path}"'.format(cmd=cmd, path=path))
         else:
-            name = name or obj.name
-            qcln('${cmd} "{name}" "{subdir}{o.name}{ext}"'.format(cmd=cmd, subdir=subdir, o=obj, name=name, ext=ext))
+            name = name or (item.obj or item.collection).name
+            qcln('${cmd} "{name}" "{path}"'.format(cmd=cmd, name=name, path=path))
 
-    def qc_exportable(obj):
-        for item in context.scene.vs.export_list:
-            if item.obj and item.obj == obj:
-                return item
-            elif item.collection:
-                if item.collection == obj:
-                    return item
-                else:
-                    for ob in item.collection.all_objects:
-                        if ob == obj:
-                            return item
-                        
-    qcln()
+    qc_exportable = index.get
 
-    if body_reference:
-        qc_item(body_reference, cmd='body', name='body')
+    qcln()
 
-    for body in bodies:
-        qc_item(body, cmd='body')
+    with profiler.span("bodies"):
+        if body_reference:
+            qc_item(body_reference, cmd='body', name='body')
 
-    def get_pose(obj):
-        if obj.type == 'ARMATURE':
-            return obj.pose
-        elif obj.parent and obj.parent.type == 'ARMATURE':
-            return obj.parent.pose
-        return None
+        for body in bodies:
+            qc_item(body, cmd='body')
+
+    # $lod N { replacemodel "ref.smd" "ref_lod1.smd" }, each LOD replaces
+    # the body with the same name without lodN, or else the reference
+    if lods:
+        with profiler.span("lods"):
+            base_bodies = {lod_base_name(body.name).lower(): body for body in bodies + [body_reference]}
+            for level in sorted(lods):
+                replacements = []
+                for item in lods[level]:
+                    base = base_bodies.get(lod_base_name(item.name).lower(), body_reference)
+                    base_file, lod_file = item_file(base), item_file(item)
+                    if base_file and lod_file:
+                        replacements.append('replacemodel "{}" "{}"'.format(base_file, lod_file))
+                if not replacements:
+                    continue
+                qcln()
+                qcln('$lod {:g}'.format(props.lod_distance * level))
+                qc_block_begin()
+                writer.lines(replacements)
+                qc_block_end()
 
     if props.collisionmodel:
         qcln()
@@ -163,51 +478,51 @@ def qc_from_vs(context):
         qcln()
 
         # Generate bone followers
-        if props.generate_bone_followers:
-            pose = None
-
-            # Look for an armature
-            if 'obj' in body_reference and body_reference.obj:
-                pose = get_pose(body_reference.obj)
-            elif 'collection' in body_reference:
-                for ob in body_reference.collection.all_objects:
-                    pose = get_pose(ob)
-                    if pose is not None:
-                        break
-
-            if pose is not None:
-                # Attachments
-                for bone in pose.bones:
-                    print(bone.name)
-                    qcln('$attachment "{bone.name}" "{bone.name}" 0 0 0'.format(bone=bone))
-                qcln()
-                qcln('$keyvalues')
-                qc_block_begin()
-                qcln('bone_followers')
-                qc_block_begin()
-                for bone in pose.bones:
-                    qcln('"bone" "{bone.name}"'.format(bone=bone))
-                qc_block_end()
-                qc_block_end()
-                qcln()
-
-
-    if len(sequences) <= 0 and body_reference:
-        qc_item(body_reference, cmd='sequence', name='idle')
-    
-    for seq in sequences:
-        if not seq.obj:
-            continue
-        obj = seq.obj
-        if obj.data.vs.action_selection == 'FILTERED':
+        if props.generate_bone_followers and body_reference:
+            with profiler.span("bone followers"):
+                pose = None
+
+                # Look for an armature
+                if body_reference.obj:
+                    pose = get_pose(body_reference.obj)
+                elif body_reference.collection:
+                    for ob in body_reference.collection.all_objects:
+                        pose = get_pose(ob)
+                        if pose is not None:
+                            break
+
+                if pose is not None:
+                    bone_names = filtered_bone_names(pose, props)
+
+                    # Attachments
+                    writer.lines('$attachment "{0}" "{0}" 0 0 0'.format(name) for name in bone_names)
+                    qcln()
+                    qcln('$keyvalues')
+                    qc_block_begin()
+                    qcln('bone_followers')
+                    qc_block_begin()
+                    writer.lines('"bone" "{}"'.format(name) for name in bone_names)
+                    qc_block_end()
+                    qc_block_end()
+                    qcln()
+
+
+    with profiler.span("sequences"):
+        if len(sequences) <= 0 and body_reference:
+            qc_item(body_reference, cmd='sequence', name='idle')
+
+        for seq in sequences:
+            if not seq.obj:
+                continue
+            obj = seq.obj
             subdir = ''
             if obj.vs.subdir and obj.vs.subdir != '.':
                 subdir = obj.vs.subdir + '/'
-            for action in actionsForFilter(obj.vs.action_filter):
+            for action in actions.for_object(obj):
                 qcln('$sequence "{o.name}" "{subdir}{o.name}{ext}"'.format(
                     subdir=subdir, o=action, ext=file_ext))
     
-    return qctxt
+    return writer.getvalue() if out is None else out
 
 
 def write_qc_file(props):
@@ -216,41 +531,11 @@ def write_qc_file(props):
     f = open(qc_path, 'w', encoding='utf8')
 
     print("Writing QC: {}".format(qc_path))
-    def writef(args): print(args, file=f)
+    writef = QCWriter(f).line
 
     writef("// Auto-generated by Blender QC File Generator")
 
-    anots = QC_Properties.__annotations__
-    for key in anots:
-        if hasattr(props, key):
-            value = getattr(props, key)
-            value_type = anots[key][0]
-            anot = anots[key][1]
-
-            if 'options' in anot and 'HIDDEN' in anot['options']:
-                print("IGNORED: " + key)
-                continue
-
-            # skip collections for now
-            if value_type == CollectionProperty:
-                continue
-
-            # skip default values
-            if 'default' in anot and value == anot['default']:
-                print("SKIPPING: " + key)
-                continue
-            
-            if type(value) == bool and value == True: # bools to flags
-                writef("$%s" % key)
-                continue
-            
-            if type(value) == str and value == '':  # discard empty strings
-                continue
-
-            if type(value) == str:
-                writef('$%s "%s"' % (key, value))
-            else:
-                writef('$%s %s' % (key, value))
+    emit_qc_directives(props, writef)
 
     for body in props.bodies:
         if body.component_type in {'body', 'model', 'sequence'}:
@@ -0,0 +1,55 @@
+from contextlib import contextmanager
+
+# Line emitter used to generate QC files.
+
+
+class QCWriter:
+    """Writes tab-indented QC lines to a sink as they are generated.
+
+    The sink can be a list (lines are appended), or anything with a write()
+    method such as an open file, io.StringIO or a bpy.types.Text block.
+    Without a sink, lines are collected in a list; see getvalue().
+    """
+
+    def __init__(self, out=None):
+        self.out = [] if out is None else out
+        self._write = self.out.append if isinstance(self.out, list) else self.out.write
+        self._tabs = ['']
+        self.indent_level = 0
+
+    def line(self, s=''):
+        self._write(self._tabs[self.indent_level] + s + '\n')
+
+    def lines(self, lines):
+        for s in lines:
+            self.line(s)
+
+    def indent(self):
+        self.indent_level += 1
+        if self.indent_level == len(self._tabs):
+            self._tabs.append('\t' * self.indent_level)
+
+    def dedent(self):
+        self.indent_level -= 1
+
+    def block_begin(self):
+        self.line('{')
+        self.indent()
+
+    def block_end(self):
+        self.dedent()
+        self.line('}')
+
+    @contextmanager
+    def block(self, header=None):
+        """with w.block('$keyvalues'): ... emits header { ... }"""
+        if header is not None:
+            self.line(header)
+        self.block_begin()
+        try:
+            yield self
+        finally:
+            self.block_end()
+
+    def getvalue(self):
+        return ''.join(self.out)
@@ -0,0 +1,54 @@
+import os
+import re
+import glob
+from collections import namedtuple
+
+from .jobs import ProcessJob
+
+# studiomdl jobs for the Compile QC operator, and the errors in their output.
+# Paths are absolute by the time they get here.
+
+# studiomdl prints "ERROR: c:\path\model.qc(12): - could not load file 'ref.smd'"
+# for errors in a QC (or a QCI it includes), and "ERROR: message" otherwise
+QC_ERROR = re.compile(r'^(?:ERROR|WARNING): (?P<file>.+?\.qci?)\((?P<line>\d+)\)\s*:?\s*-?\s*(?P<message>.*)$', re.I)
+ERROR = re.compile(r'^ERROR:\s*(?P<message>.+)$', re.I)
+
+QCError = namedtuple('QCError', 'file line message')
+
+
+def parse_errors(lines):
+    """QCErrors in studiomdl's output, line is None for errors without one"""
+    errors = []
+    for ln in lines:
+        ln = ln.strip()
+        m = QC_ERROR.match(ln)
+        if m:
+            if ln[:5].upper() == 'ERROR':
+                errors.append(QCError(m.group('file'), int(m.group('line')), m.group('message')))
+            continue
+        m = ERROR.match(ln)
+        if m:
+            errors.append(QCError(None, None, m.group('message')))
+    return errors
+
+def format_error(error):
+    if error.line is None:
+        return error.message
+    return "{}({}): {}".format(os.path.basename(error.file), error.line, error.message)
+
+
+def find_qc_files(pattern):
+    """QC files matching a path that may contain wildcards, like Blender Source Tools' QC Path"""
+    if not pattern:
+        return []
+    return sorted(path for path in glob.glob(pattern) if os.path.isfile(path))
+
+def studiomdl_command(studiomdl, game_path, qc_path):
+    return [studiomdl, "-nop4", "-game", game_path, qc_path]
+
+def studiomdl_job(studiomdl, game_path, qc_path):
+    # relative $body paths are relative to the QC's folder
+    job = ProcessJob(os.path.basename(qc_path), studiomdl_command(studiomdl, game_path, qc_path),
+                     cwd=os.path.dirname(qc_path))
+    job.qc_path = qc_path
+    return job
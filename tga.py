@@ -0,0 +1,156 @@
+import os
+import struct
+
+import numpy as np
+
+# Writes Blender images to TGA files for vtex, for images that have no TGA or
+# PSD next to them: packed and generated images, PNGs, EXRs...
+# Also reads TGAs for the built-in VTF compiler, see vtf.py.
+
+# written to the TGA's ID field, so the add-on knows which TGAs it may overwrite
+TGA_ID = b"qc_generator"
+
+TGA_TRUECOLOR = 2
+TGA_GRAYSCALE = 3
+TGA_RLE = 8         # added to the type of run-length encoded images
+
+# color spaces whose pixels are data, not colors (normal maps, masks...)
+NON_COLOR_SPACES = {'Non-Color', 'Raw', 'Generic Data'}
+
+
+def srgb_lut(size=1 << 16):
+    """8 bit sRGB values for linear values 0..1 in size steps"""
+    x = np.linspace(0.0, 1.0, size)
+    srgb = np.where(x <= 0.0031308, x * 12.92, 1.055 * np.power(x, 1 / 2.4) - 0.055)
+    return (srgb * 255 + 0.5).astype(np.uint8)
+
+SRGB_LUT = srgb_lut()
+
+
+def image_pixels(img):
+    """The image's pixels as a (height, width, channels) uint8 array, bottom row
+    first like Blender stores them. Float images are converted to sRGB unless
+    their color space is non-color data."""
+    width, height = img.size
+    channels = img.channels
+    count = width * height * channels
+    if not count or len(img.pixels) != count:
+        raise ValueError("{} has no pixel data".format(img.name))
+
+    px = np.empty(count, dtype=np.float32)
+    img.pixels.foreach_get(px)
+
+    # byte images come back as byte / 255 in their own color space, float ones are linear.
+    # Everything is converted in place on the whole buffer, ops on a strided
+    # view of the color channels are several times slower.
+    if img.is_float and img.colorspace_settings.name not in NON_COLOR_SPACES:
+        alpha = px[channels - 1::channels].copy() if channels in (2, 4) else None
+        top = len(SRGB_LUT) - 1
+        np.clip(px, 0.0, 1.0, out=px)
+        np.multiply(px, top, out=px)
+        np.add(px, 0.5, out=px)
+        out = SRGB_LUT.take(px.astype(np.uint16))
+        if alpha is not None:
+            out[channels - 1::channels] = to_bytes(alpha)
+    else:
+        out = to_bytes(px)
+    return out.reshape(height, width, channels)
+
+def to_bytes(px):
+    """Rounds 0..1 floats to uint8, scaling px in place"""
+    np.clip(px, 0.0, 1.0, out=px)
+    np.multiply(px, 255.0, out=px)
+    np.add(px, 0.5, out=px)
+    return px.astype(np.uint8)
+
+
+def tga_data(pixels):
+    """(image type, bits per pixel, alpha bits, BGR(A) data) for (height, width, channels)
+    uint8 pixels. Drops alpha when it's fully opaque, so vtex picks a format without it."""
+    channels = pixels.shape[2]
+    if channels == 1:
+        return TGA_GRAYSCALE, 8, 0, pixels
+    if channels == 2:   # gray and alpha, keep the gray
+        return TGA_GRAYSCALE, 8, 0, pixels[..., :1]
+    if channels == 4 and not (pixels[..., 3] == 255).all():
+        return TGA_TRUECOLOR, 32, 8, pixels[..., [2, 1, 0, 3]]
+    return TGA_TRUECOLOR, 24, 0, pixels[..., 2::-1]
+
+def write_tga(path, pixels):
+    """Writes (height, width, channels) uint8 pixels, bottom row first, as an
+    uncompressed TGA"""
+    height, width = pixels.shape[:2]
+    image_type, bpp, alpha_bits, data = tga_data(pixels)
+    # bottom-left origin, the rows are already in TGA order
+    header = struct.pack('<BBBHHBHHHHBB', len(TGA_ID), 0, image_type, 0, 0, 0, 0, 0,
+                         width, height, bpp, alpha_bits)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header + TGA_ID)
+        f.write(np.ascontiguousarray(data).data)
+    os.replace(tmp_path, path)
+
+def export_image(img, path):
+    write_tga(path, image_pixels(img))
+
+
+def is_exported(path):
+    """True if the TGA at path was written by export_image()"""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(18 + len(TGA_ID))
+    except OSError:
+        return False
+    return len(header) == 18 + len(TGA_ID) and header[0] == len(TGA_ID) and header[18:] == TGA_ID
+
+
+def read_tga(path):
+    """The pixels of a true color or grayscale TGA as a (height, width, channels)
+    uint8 array, top row first, RGB(A) or gray"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < 18:
+        raise ValueError("{} is not a TGA file".format(os.path.basename(path)))
+    id_length, colormap_type, image_type = data[0], data[1], data[2]
+    colormap_length, colormap_bits = struct.unpack_from('<HB', data, 5)
+    width, height, bpp, descriptor = struct.unpack_from('<HHBB', data, 12)
+
+    if image_type & ~TGA_RLE not in (TGA_TRUECOLOR, TGA_GRAYSCALE) or bpp not in (8, 24, 32):
+        raise ValueError("{}: only 8, 24 and 32 bit true color or grayscale TGAs are supported".format(
+            os.path.basename(path)))
+    channels = bpp // 8
+    offset = 18 + id_length + (colormap_length * ((colormap_bits + 7) // 8) if colormap_type else 0)
+    size = width * height * channels
+
+    if image_type & TGA_RLE:
+        pixels = rle_decode(data, offset, size, channels)
+    else:
+        pixels = data[offset:offset + size]
+    if len(pixels) < size:
+        raise ValueError("{} is truncated".format(os.path.basename(path)))
+
+    px = np.frombuffer(pixels, dtype=np.uint8, count=size).reshape(height, width, channels)
+    if not descriptor & 0x20:   # bottom-left origin
+        px = px[::-1]
+    if descriptor & 0x10:       # right to left
+        px = px[:, ::-1]
+    if channels >= 3:           # BGR(A) -> RGB(A)
+        px = px[..., [2, 1, 0, 3][:channels]]
+    return np.ascontiguousarray(px)
+
+def rle_decode(data, offset, size, channels):
+    """Loops over the packets, not the pixels: a run is one bytes multiplication"""
+    out = bytearray()
+    while len(out) < size and offset < len(data):
+        header = data[offset]
+        offset += 1
+        count = (header & 0x7f) + 1
+        if header & 0x80:
+            out += data[offset:offset + channels] * count
+            offset += channels
+        else:
+            out += data[offset:offset + count * channels]
+            offset += count * channels
+    return bytes(out)
@@ -1,12 +1,14 @@
 import os
-import subprocess
+import time
 import bpy
 
 from bpy.types import PropertyGroup, StringProperty, PointerProperty, CollectionProperty, BoolProperty, EnumProperty, FloatProperty
 from bpy.types import Operator
 from bpy.props import *
 
-from . import BasePanel, QC_PT_Paths
+from . import BasePanel, QC_PT_Paths, get_profiler, report_profile
+from .fsindex import texture_index
+from .profiling import NULL_PROFILER
 
 TEX_FILE_EXTS = ('.tga', '.psd')
 VMT_FILE_EXT = '.vmt'
@@ -16,9 +18,273 @@ class VMT_Properties(PropertyGroup):
         name="Texture Folder",
         default="//"
     )
+    vmt_template: PointerProperty(
+        name="VMT Template",
+        description="Text block to use as the template for new VMTs, see vmt_template.py",
+        type=bpy.types.Text
+    )
+    images_active: IntProperty(
+        name="Active Image", default=0, min=0, options={'HIDDEN'})
+    materials_active: IntProperty(
+        name="Active Material", default=0, min=0, options={'HIDDEN'})
+    vtf_backend: EnumProperty(
+        name="VTF Compiler",
+        description="What compiles the images to VTFs",
+        items=[
+            ('VTEX', "vtex", "vtex.exe from the Engine Path"),
+            ('BUILTIN', "Built-in", "Compile in Blender without vtex, on any OS. Reads TGA sources and their vtex .txt settings"),
+        ],
+        default='VTEX'
+    )
 
 
-class VMT_OT_MakeVTF(Operator):
+def image_file_stem(img):
+    """Name without extension of an image's TGA/PSD, and so of its VTF. Images
+    without a file (generated ones) use their name, made safe for a file name."""
+    if img.filepath:
+        return os.path.splitext(bpy.path.basename(bpy.path.abspath(img.filepath)))[0]
+    return bpy.path.clean_name(img.name)
+
+def image_source_base(img):
+    """Path without extension of an image's TGA/PSD: next to its file, or in the
+    Texture Folder for images without one (generated ones)"""
+    if img.filepath:
+        return os.path.splitext(bpy.path.abspath(img.filepath))[0]
+    return os.path.join(bpy.path.abspath(bpy.context.scene.vmtgen.tex_dir), image_file_stem(img))
+
+def find_texture_source(img):
+    """Returns the TGA/PSD next to an image's file, or None"""
+    img_base = image_source_base(img)
+    for ext in TEX_FILE_EXTS:
+        if os.path.exists(img_base + ext):
+            return img_base + ext
+    return None
+
+def can_compile(img):
+    return img.type == 'IMAGE' or img.source == 'GENERATED'
+
+def needs_export(img, tga_path, force=False):
+    """True if tga_path was exported from img, and img changed since or force is set.
+    TGAs the add-on didn't write are never overwritten."""
+    from .tga import is_exported
+    changed = force or img.is_dirty
+    if not changed and img.filepath and not img.packed_file:
+        try:
+            changed = os.path.getmtime(bpy.path.abspath(img.filepath)) > os.path.getmtime(tga_path)
+        except OSError:
+            pass
+    return changed and is_exported(tga_path)
+
+def texture_source(img, force=False, profiler=NULL_PROFILER):
+    """The TGA/PSD to compile an image from, exporting a TGA from its pixels if it
+    has none or needs_export(). Raises ValueError or OSError if that fails."""
+    img_path = find_texture_source(img)
+    if img_path and not needs_export(img, img_path, force):
+        return img_path
+
+    from .tga import export_image, is_exported
+    img_path = image_source_base(img) + '.tga'
+    if os.path.exists(img_path) and not is_exported(img_path):
+        return img_path     # saved by hand since it was looked for, use it as it is
+    with profiler.span("export tga", image=img.name, size=list(img.size)):
+        export_image(img, img_path)
+    return img_path
+
+def get_vtex_path(context):
+    return os.path.join(bpy.path.abspath(context.scene.vs.engine_path), "vtex.exe")
+
+def get_materials_dir(context):
+    return os.path.join(context.scene.vs.game_path, 'materials', context.scene.qcgen.cdmaterials)
+
+def vtex_command(context, img_path):
+    return [
+        get_vtex_path(context),
+        "-game", context.scene.vs.game_path,
+        "-nopause",
+        "-nop4",
+        "-outdir", get_materials_dir(context),
+        img_path
+    ]
+
+class VTFCompileJobs:
+    """Runs vtex (or built-in compiler) jobs from a modal timer, streaming their output into a text block.
+    Used by the compile operators below, press ESC or Cancel to stop."""
+
+    log_name = "vtex.log"
+
+    def start_jobs(self, context, jobs, manifest, max_running=None, skipped=()):
+        from .jobs import JobQueue
+
+        self.queue = JobQueue(jobs, max_running)
+        self.manifest = manifest
+        self.skipped = list(skipped)
+        self.verified = {}      # job -> VTFInfo of its output, if it's valid
+        self.cancelled = False
+        self.start_time = time.perf_counter()
+        self._timer = None
+
+        self.log = bpy.data.texts.get(self.log_name) or bpy.data.texts.new(self.log_name)
+        self.log.clear()
+
+        # no event loop in background mode, just wait for the jobs
+        if context.window is None or not jobs:
+            self.queue.wait()
+            for job in self.queue.finished:
+                self.log_job(job, job.log)
+                self.job_finished(job)
+            return self.finish(context)
+
+        wm = context.window_manager
+        wm.progress_begin(0, max(1, self.queue.total))
+        self._timer = wm.event_timer_add(0.1, window=context.window)
+        wm.modal_handler_add(self)
+        running_compiles.append(self)
+        self.update_jobs(context)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC' or (self.cancel_requested and not self.cancelled):
+            self.cancel_jobs()
+        elif event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        self.update_jobs(context)
+        if self.queue.done:
+            return self.finish(context)
+        return {'PASS_THROUGH'}
+
+    def update_jobs(self, context):
+        for job in self.queue.update():
+            self.log_job(job, job.read_lines())
+            self.job_finished(job)
+        for job in self.queue.running:
+            self.log_job(job, job.read_lines())
+
+        context.window_manager.progress_update(len(self.queue.finished))
+        for area in context.screen.areas if context.screen else ():
+            if area.type in {'TEXT_EDITOR', 'PROPERTIES'}:
+                area.tag_redraw()
+
+    def log_job(self, job, lines):
+        if not lines:
+            return
+        prefix = "[{}] ".format(job.name) if self.queue.total > 1 else ""
+        self.log.write("".join(prefix + ln + "\n" for ln in lines))
+
+    def job_finished(self, job):
+        from .vtf import verify
+        from .vtf_cache import vtf_output_path
+
+        # vtex can exit 0 and still leave a broken or empty VTF behind
+        if job.succeeded:
+            info, problem = verify(vtf_output_path(self.manifest.out_dir, job.source), job.source)
+            if problem:
+                self.log_job(job, ["{}: {}".format("WARNING" if info else "ERROR", problem)])
+            if info:
+                self.verified[job] = info
+        if job in self.verified:
+            self.manifest.record(job.source, job.args)
+        else:
+            self.manifest.forget(job.source)
+
+    def cancel_jobs(self):
+        self.cancelled = True
+        self.queue.cancel()
+
+    cancel_requested = False
+    profiler = NULL_PROFILER
+
+    @property
+    def progress(self):
+        return len(self.queue.finished), self.queue.total
+
+    def finish(self, context):
+        # nothing to remove when the jobs ran without the modal timer (background mode or no jobs)
+        if self._timer is not None:
+            wm = context.window_manager
+            wm.event_timer_remove(self._timer)
+            wm.progress_end()
+            self._timer = None
+        if self in running_compiles:
+            running_compiles.remove(self)
+
+        with self.profiler.span("manifest save"):
+            self.manifest.save()
+        refresh_texture_index()
+
+        from .vtf import describe
+
+        jobs = self.queue.finished
+        failed = [job for job in jobs if job not in self.verified]
+        elapsed = time.perf_counter() - self.start_time
+
+        # vtex runs are timed by the jobs themselves, concurrent ones get their own trace lanes
+        for job in jobs:
+            if job.started:
+                self.profiler.add_job(job.name, job.start_time, job.start_time + job.elapsed, returncode=job.returncode)
+
+        lines = ["", "VTF compile: {} textures in {:.2f}s".format(len(jobs), elapsed)]
+        for job in jobs:
+            if job.cancelled:
+                status = "cancelled"
+            elif job.succeeded and job not in self.verified:
+                status = "invalid VTF"
+            else:
+                status = "exit {:<4}".format(job.returncode)
+            line = "{:<40} {} {:.2f}s".format(job.name, status, job.elapsed)
+            if job in self.verified:
+                line += "  " + describe(self.verified[job])
+            lines.append(line)
+        for name, reason in self.skipped:
+            lines.append("{:<40} {}".format(name, reason))
+        summary = "\n".join(lines) + "\n"
+        self.log.write(summary)
+        print(summary)
+
+        msg = "Compiled {} textures in {:.2f}s, {} failed, {} skipped".format(
+            len(jobs) - len(failed), elapsed, len(failed), len(self.skipped))
+        if self.cancelled:
+            self.report({'WARNING'}, "Cancelled. " + msg)
+            return {'CANCELLED'}
+        self.report({'WARNING'} if failed else {'INFO'}, msg)
+        report_profile(context, self.profiler, self)
+        return {'FINISHED'}
+
+# compiles currently running in modal operators, for the panel's progress/cancel UI
+running_compiles = []
+
+def vtex_job(context, name, img_path):
+    from .jobs import ProcessJob
+    job = ProcessJob(name, vtex_command(context, img_path))
+    job.source = img_path
+    return job
+
+def builtin_vtf_job(context, name, img_path):
+    from .jobs import ThreadJob
+    from .vtf import compile_texture, WRITER_VERSION
+    from .vtf_cache import vtf_output_path, vtex_settings_path
+    out_dir = get_materials_dir(context)
+    vtf_path = vtf_output_path(out_dir, img_path)
+    # the args stand in for vtex's command line in the manifest
+    job = ThreadJob(name, lambda job: compile_texture(img_path, vtf_path, vtex_settings_path(img_path), job.print),
+                    ["builtin", str(WRITER_VERSION), "-outdir", out_dir, img_path])
+    job.source = img_path
+    return job
+
+def vtf_job(context, name, img_path):
+    if context.scene.vmtgen.vtf_backend == 'BUILTIN':
+        return builtin_vtf_job(context, name, img_path)
+    return vtex_job(context, name, img_path)
+
+def missing_vtex(context):
+    """The path of vtex.exe if it's needed and not there"""
+    vtex_path = get_vtex_path(context)
+    if context.scene.vmtgen.vtf_backend == 'VTEX' and not os.path.exists(vtex_path):
+        return vtex_path
+    return None
+
+
+class VMT_OT_MakeVTF(VTFCompileJobs, Operator):
     """Compile an image to a VTF file"""
     bl_idname = "vmtgen.compile"
     bl_label = "Compile an image to a VTF"
@@ -26,51 +292,136 @@ class VMT_OT_MakeVTF(Operator):
     img_name : StringProperty(
         name="Image Name"
     )
+    force: BoolProperty(
+        name="Force",
+        description="Compile even if the VTF is up to date",
+        default=False
+    )
 
     def execute(self, context):
-        img = None
-        for image in bpy.data.images:
-            if image.name == self.img_name:
-                img = image
+        from .vtf_cache import VTFManifest
+        self.profiler = get_profiler(context, "vmtgen_compile")
+        img = bpy.data.images.get(self.img_name)
 
         if img == None:
             self.report({'ERROR'}, "No image found with name: " + self.img_name)
             return {'FINISHED'}
 
-        img_base = os.path.splitext(bpy.path.abspath(img.filepath))[0]
-        img_path = None
+        with self.profiler.span("find source"):
+            try:
+                img_path = texture_source(img, self.force, self.profiler)
+            except (ValueError, OSError) as e:
+                self.report({'ERROR'}, "No TGA or PSD found for {} and it can't be exported: {}".format(img.name, e))
+                return {'FINISHED'}
 
-        for ext in TEX_FILE_EXTS:
-            if os.path.exists(img_base + ext):
-                img_path = img_base + ext
-                break
+        vtex_path = missing_vtex(context)
+        if vtex_path:
+            self.report({'ERROR'}, "Can't find vtex.exe: " + vtex_path)
+            return {'FINISHED'}
 
-        if img_path == None:
-            self.report({'ERROR'}, "No TGA or PSD found for {}. Save a copy of your image as a PSD or TGA! ".format(img_base))
+        job = vtf_job(context, img.name, img_path)
+        with self.profiler.span("manifest check"):
+            manifest = VTFManifest(get_materials_dir(context))
+            current = not self.force and manifest.is_current(img_path, job.args)
+        if current:
+            manifest.save()
+            self.report({'INFO'}, "{} is up to date".format(os.path.basename(img_path)))
+            report_profile(context, self.profiler, self)
             return {'FINISHED'}
 
-        vtex_path = os.path.join(bpy.path.abspath(context.scene.vs.engine_path), "vtex.exe")
-        if not os.path.exists(vtex_path):
+        return self.start_jobs(context, [job], manifest)
+
+
+def images_to_compile(context, selected_only=False):
+    """Images that can be compiled, optionally only those used by the selected objects"""
+    images = [img for img in bpy.data.images if can_compile(img)]
+    if not selected_only:
+        return images
+
+    used = set()
+    for ob in context.selected_objects:
+        for slot in getattr(ob, 'material_slots', ()):
+            mat = slot.material
+            if mat and mat.use_nodes and mat.node_tree:
+                for node in mat.node_tree.nodes:
+                    if node.type == 'TEX_IMAGE' and node.image:
+                        used.add(node.image.name)
+    return [img for img in images if img.name in used]
+
+class VMT_OT_MakeAllVTF(VTFCompileJobs, Operator):
+    """Compile every image to a VTF file, running several vtex jobs at once"""
+    bl_idname = "vmtgen.compile_all"
+    bl_label = "Compile All Textures"
+
+    selected_only: BoolProperty(
+        name="Selected Objects Only",
+        description="Only compile images used by the materials of the selected objects",
+        default=False
+    )
+    force: BoolProperty(
+        name="Force",
+        description="Compile even if the VTFs are up to date",
+        default=False
+    )
+
+    def execute(self, context):
+        from .vtf_cache import VTFManifest
+        self.profiler = get_profiler(context, "vmtgen_compile_all")
+
+        vtex_path = missing_vtex(context)
+        if vtex_path:
             self.report({'ERROR'}, "Can't find vtex.exe: " + vtex_path)
             return {'FINISHED'}
 
-        #self.report({'INFO'}, vtex_path)
-        #self.report({'INFO'}, img_path)
-
-        mat_path = os.path.join(context.scene.vs.game_path, 'materials', context.scene.qcgen.cdmaterials)
-
-        print("Running vtex for \"{}\"...\n".format(os.path.basename(img_path)))
-        vtex = subprocess.Popen([
-            vtex_path,
-            "-game", context.scene.vs.game_path,
-            "-nopause",
-            "-nop4",
-            "-outdir", mat_path,
-            img_path
-        ])
-        vtex.communicate()
-        
-        return{'FINISHED'}
+        manifest = VTFManifest(get_materials_dir(context))
+        jobs = []
+        skipped = []
+        with self.profiler.span("manifest check"):
+            for img in images_to_compile(context, self.selected_only):
+                with self.profiler.span("find source", image=img.name):
+                    try:
+                        img_path = texture_source(img, self.force, self.profiler)
+                    except (ValueError, OSError) as e:
+                        skipped.append((img.name, "skipped (no TGA or PSD, {})".format(e)))
+                        continue
+                job = vtf_job(context, img.name, img_path)
+                if not self.force and manifest.is_current(img_path, job.args):
+                    skipped.append((img.name, "up to date"))
+                    continue
+                jobs.append(job)
+
+        # one vtex process (or built-in compile thread) per core
+        return self.start_jobs(context, jobs, manifest, os.cpu_count(), skipped)
+
+class VMT_OT_CancelVTF(Operator):
+    """Stop the running VTF compiles"""
+    bl_idname = "vmtgen.compile_cancel"
+    bl_label = "Cancel VTF Compile"
+
+    @classmethod
+    def poll(cls, context):
+        return len(running_compiles) > 0
+
+    def execute(self, context):
+        for compile_op in running_compiles:
+            compile_op.cancel_requested = True
+        return {'FINISHED'}
+
+
+def get_vmt_template(context):
+    from .vmt_template import compile_template, DEFAULT_VMT_TEMPLATE
+    text = context.scene.vmtgen.vmt_template
+    return compile_template(text.as_string() if text else DEFAULT_VMT_TEMPLATE)
+
+def vmt_text(context, mat, template=None):
+    """VMT for a material, with parameters from its node tree"""
+    from .vmt_template import material_params
+    template = template or get_vmt_template(context)
+    return template.render(material_params(mat, context.scene.qcgen.cdmaterials, image_file_stem))
+
+def write_vmt(vmt_path, text):
+    with open(vmt_path, 'w', encoding='utf8') as f:
+        f.write(text)
 
 
 class VMT_OT_MakeVMT(Operator):
@@ -83,19 +434,16 @@ class VMT_OT_MakeVMT(Operator):
     )
 
     def execute(self, context):
-        mat = None
-        for m in bpy.data.materials:
-            if m.name == self.mat_name:
-                mat = m
+        profiler = get_profiler(context, "vmtgen_generate")
+        mat = bpy.data.materials.get(self.mat_name)
 
         if mat == None:
             self.report(
                 {'ERROR'}, "No material found with name: " + self.mat_name)
             return {'FINISHED'}
 
-        mat_path = os.path.join(context.scene.vs.game_path, 'materials', context.scene.qcgen.cdmaterials)
+        mat_path = get_materials_dir(context)
         vmt_path = os.path.join(mat_path, mat.name + VMT_FILE_EXT)
-        vtf_path = os.path.join(context.scene.qcgen.cdmaterials, os.path.splitext(os.path.basename(vmt_path))[0])
 
         #self.report({'INFO'}, vmt_path)
 
@@ -104,14 +452,10 @@ class VMT_OT_MakeVMT(Operator):
 
         # create if the VMT doesn't already exist 
         if not os.path.exists(vmt_path):
-            f = open(vmt_path, 'w', encoding='utf8')
-            def writef(args): print(args, file=f)
-            writef('VertexLitGeneric')
-            writef('{')
-            writef('\t$basetexture "%s"' % vtf_path)
-            writef('\t//$bumpmap "%s"' % (vtf_path + "_normal"))
-            writef('}')
-            f.close()
+            with profiler.span("template"):
+                vmt = vmt_text(context, mat)
+            with profiler.span("write file"):
+                write_vmt(vmt_path, vmt)
             self.report({'INFO'}, "VMT file has been created and can be viewed in the Text Editor.")
         else:
             self.report({'INFO'}, "VMT file has been opened and can be viewed in the Text Editor.")
@@ -125,23 +469,160 @@ class VMT_OT_MakeVMT(Operator):
             text_editor = None
         
         vmt_name = mat.name + VMT_FILE_EXT
-        for text in bpy.data.texts:
-            if text.name.startswith(vmt_name):
-                # vmt file is already open, switch to it
-                if text_editor:
-                    text_editor.text = text
-                break
+        text = bpy.data.texts.get(vmt_name) or next(
+            (t for t in bpy.data.texts if t.name.startswith(vmt_name)), None)
+        if text:
+            # vmt file is already open, switch to it
+            if text_editor:
+                text_editor.text = text
         else:
             # open the vmt file and show in text editor
-            bpy.ops.text.open(filepath=vmt_path)
+            with profiler.span("open text"):
+                bpy.ops.text.open(filepath=vmt_path)
             if text_editor:
                 text_editor.text = bpy.data.texts[vmt_name]
 
+        report_profile(context, profiler, self)
+        return{'FINISHED'}
+
+
+def model_materials(context):
+    """Materials of the objects in the Source Engine export list, in order"""
+    from .qcfile import ExportIndex
+
+    materials = {}
+    for ob in ExportIndex(context.scene.vs.export_list).items:
+        for slot in getattr(ob, 'material_slots', ()):
+            if slot.material:
+                materials[slot.material.name] = slot.material
+    return list(materials.values())
+
+class VMT_OT_MakeAllVMT(Operator):
+    """Create the missing VMT files for every material of the model"""
+    bl_idname = "vmtgen.generate_all"
+    bl_label = "Create Missing VMTs"
+
+    all_materials: BoolProperty(
+        name="All Materials",
+        description="Every material in the file instead of only those of the exported objects",
+        default=False
+    )
+
+    def execute(self, context):
+        if self.all_materials:
+            materials = [mat for mat in bpy.data.materials if mat.name != "Dots Stroke"]
+        else:
+            materials = model_materials(context)
+
+        mat_path = get_materials_dir(context)
+        os.makedirs(mat_path, exist_ok=True)
+
+        # one directory listing instead of an exists() per material,
+        # the game's filesystem is case insensitive
+        existing = {entry.name.lower() for entry in os.scandir(mat_path)}
+        template = get_vmt_template(context)
+
+        created = 0
+        skipped = 0
+        for mat in materials:
+            vmt_name = mat.name + VMT_FILE_EXT
+            if vmt_name.lower() in existing:
+                skipped += 1
+                continue
+            write_vmt(os.path.join(mat_path, vmt_name), vmt_text(context, mat, template))
+            existing.add(vmt_name.lower())
+            created += 1
+
+        self.report({'INFO'}, "Created {} VMT files, {} already existed".format(created, skipped))
         return{'FINISHED'}
 
 class VMT_PT_Paths(QC_PT_Paths, bpy.types.Panel):
     bl_parent_id = "VMT_PT_VMTPanel"
 
+# Filter results of the lists below, reused across redraws until the blend data
+# changes, so redrawing only costs the rows that are visible.
+filter_cache = {}
+
+@bpy.app.handlers.persistent
+def clear_filter_cache(*args):
+    filter_cache.clear()
+
+class CachedFilterList:
+    hide_unused: BoolProperty(
+        name="Hide Unused",
+        description="Hide datablocks that nothing uses",
+        default=False
+    )
+
+    def include_item(self, item):
+        return True
+
+    def draw_filter(self, context, layout):
+        row = layout.row(align=True)
+        row.prop(self, 'filter_name', text="")
+        row.prop(self, 'hide_unused', text="", icon='ORPHAN_DATA')
+        row.prop(self, 'use_filter_sort_alpha', text="", icon='SORTALPHA')
+
+    def filter_items(self, context, data, propname):
+        items = getattr(data, propname)
+        key = (type(self).__name__, propname, self.filter_name,
+            self.hide_unused, self.use_filter_sort_alpha, len(items))
+        cached = filter_cache.get(key)
+        if cached is not None:
+            return cached
+
+        helpers = bpy.types.UI_UL_list
+        if self.filter_name:
+            flt_flags = helpers.filter_items_by_name(self.filter_name, self.bitflag_filter_item, items, "name")
+        else:
+            flt_flags = [self.bitflag_filter_item] * len(items)
+
+        for i, item in enumerate(items):
+            if not flt_flags[i]:
+                continue
+            if not self.include_item(item) or (self.hide_unused and item.users - item.use_fake_user <= 0):
+                flt_flags[i] = 0
+
+        flt_neworder = helpers.sort_items_by_name(items, "name") if self.use_filter_sort_alpha else []
+
+        filter_cache[key] = flt_flags, flt_neworder
+        return flt_flags, flt_neworder
+
+# texture_index.status() -> icon
+VTF_STATUS_ICONS = {
+    None: 'BLANK1',             # not scanned yet
+    'NO_SOURCE': 'QUESTION',    # no TGA or PSD
+    'MISSING': 'X',             # no VTF
+    'STALE': 'FILE_REFRESH',    # VTF is older than its source
+    'INVALID': 'ERROR',         # VTF header is broken or the file is truncated
+    'UP_TO_DATE': 'CHECKMARK',
+}
+
+class VMT_UL_Images(CachedFilterList, bpy.types.UIList):
+    def include_item(self, img):
+        return can_compile(img)
+
+    def draw_item(self, context, layout, data, item, icon, active_data, active_propname, index):
+        name = bpy.path.basename(item.filepath) or item.name
+        if self.layout_type in {'DEFAULT', 'COMPACT'}:
+            row = layout.row()
+            row.operator('vmtgen.compile', text=name, icon='IMAGE', emboss=False).img_name = item.name
+            row.label(text="", icon=VTF_STATUS_ICONS[texture_index.status(image_source_base(item))])
+        elif self.layout_type in {'GRID'}:
+            layout.alignment = 'CENTER'
+            layout.label(text="", icon='IMAGE')
+
+class VMT_UL_Materials(CachedFilterList, bpy.types.UIList):
+    def include_item(self, mat):
+        return mat.name != "Dots Stroke"
+
+    def draw_item(self, context, layout, data, item, icon, active_data, active_propname, index):
+        if self.layout_type in {'DEFAULT', 'COMPACT'}:
+            layout.operator('vmtgen.generate', text=item.name, icon='MATERIAL', emboss=False).mat_name = item.name
+        elif self.layout_type in {'GRID'}:
+            layout.alignment = 'CENTER'
+            layout.label(text="", icon='MATERIAL')
+
 class VMT_PT_VMTSettings(BasePanel, bpy.types.Panel):
     bl_parent_id = "VMT_PT_VMTPanel"
     bl_label = "Materials"
@@ -154,19 +635,32 @@ class VMT_PT_VMTSettings(BasePanel, bpy.types.Panel):
         #mat_path = os.path.join(context.scene.vs.game_path, 'materials', context.scene.qcgen.cdmaterials)
         #layout.label(text=mat_path)
 
-        layout.label(text="Compile VTF for Images: (Requires TGA/PSD file)")
-        col = layout.column_flow(columns=2)
-        for img in bpy.data.images:
-            if img.type == 'IMAGE':
-                col.operator('vmtgen.compile', text=bpy.path.basename(img.filepath), icon='IMAGE').img_name = img.name
+        watch_texture_index()
+        layout.label(text="Compile VTF for Images:")
+        layout.prop(vmtgen, 'vtf_backend')
+        if running_compiles:
+            done, total = running_compiles[0].progress
+            row = layout.row()
+            row.label(text="Compiling {}/{}...".format(done, total), icon='TIME')
+            row.operator('vmtgen.compile_cancel', text="Cancel", icon='CANCEL')
+        else:
+            row = layout.row(align=True)
+            row.operator('vmtgen.compile_all', icon='RENDER_STILL')
+            row.operator('vmtgen.refresh_index', text="", icon='FILE_REFRESH')
+        layout.template_list("VMT_UL_Images", "", bpy.data, "images", vmtgen, "images_active", rows=6)
+        images = bpy.data.images
+        if 0 <= vmtgen.images_active < len(images):
+            info = texture_index.vtf_info(image_source_base(images[vmtgen.images_active]))
+            if info:
+                from .vtf import describe
+                layout.label(text=describe(info), icon='TEXTURE')
 
         layout.separator()
         
         layout.label(text="Create/Open VMT for Materials:")
-        col = layout.column_flow(columns=2)
-        for mat in bpy.data.materials:
-            if mat.name != "Dots Stroke":
-                col.operator('vmtgen.generate', text=mat.name, icon='MATERIAL').mat_name = mat.name
+        layout.operator('vmtgen.generate_all', icon='FILE_NEW')
+        layout.prop(vmtgen, 'vmt_template')
+        layout.template_list("VMT_UL_Materials", "", bpy.data, "materials", vmtgen, "materials_active", rows=6)
 
 class VMT_PT_VMTPanel(BasePanel, bpy.types.Panel):
     """Creates a Panel in the scene context of the properties editor"""
@@ -178,11 +672,80 @@ class VMT_PT_VMTPanel(BasePanel, bpy.types.Panel):
 
 
 
+# Rescan the texture folders every few seconds, but only while the panel is
+# drawn: its draw() calls watch_texture_index(), which starts the timer, and
+# the timer stops once the panel wasn't drawn for TEXTURE_INDEX_IDLE seconds
+TEXTURE_INDEX_INTERVAL = 5.0
+TEXTURE_INDEX_IDLE = 10.0
+texture_index_generation = 0
+texture_index_drawn = 0.0
+
+def watch_texture_index():
+    global texture_index_drawn
+    texture_index_drawn = time.monotonic()
+    if not bpy.app.timers.is_registered(texture_index_timer):
+        bpy.app.timers.register(texture_index_timer, first_interval=0.0)
+
+def texture_index_timer():
+    if time.monotonic() - texture_index_drawn > TEXTURE_INDEX_IDLE:
+        return None
+    refresh_texture_index()
+    return TEXTURE_INDEX_INTERVAL
+
+def refresh_texture_index():
+    global texture_index_generation
+    scene = bpy.context.scene
+    if scene is None or not getattr(scene, 'vs', None):
+        return
+
+    source_dirs = {os.path.dirname(image_source_base(img))
+        for img in bpy.data.images if can_compile(img)}
+    source_dirs.add(bpy.path.abspath(scene.vmtgen.tex_dir))
+    # always rescan, files change without the folder set changing
+    texture_index.refresh(source_dirs, get_materials_dir(bpy.context), force=True)
+
+    # redraw the status icons once a scan finished
+    if texture_index.generation != texture_index_generation:
+        texture_index_generation = texture_index.generation
+        for window in bpy.context.window_manager.windows:
+            for area in window.screen.areas:
+                if area.type == 'PROPERTIES':
+                    area.tag_redraw()
+
+class VMT_OT_RefreshIndex(Operator):
+    """Rescan the texture and VTF folders"""
+    bl_idname = "vmtgen.refresh_index"
+    bl_label = "Refresh Texture Status"
+
+    def execute(self, context):
+        refresh_texture_index()
+        return {'FINISHED'}
+
+
+def register():
+    bpy.app.handlers.depsgraph_update_post.append(clear_filter_cache)
+    bpy.app.handlers.load_post.append(clear_filter_cache)
+
+def unregister():
+    for handlers in (bpy.app.handlers.depsgraph_update_post, bpy.app.handlers.load_post):
+        if clear_filter_cache in handlers:
+            handlers.remove(clear_filter_cache)
+    filter_cache.clear()
+    if bpy.app.timers.is_registered(texture_index_timer):
+        bpy.app.timers.unregister(texture_index_timer)
+
+
 classes_vmt = (
     VMT_Properties,
     VMT_OT_MakeVTF,
+    VMT_OT_MakeAllVTF,
+    VMT_OT_CancelVTF,
+    VMT_OT_RefreshIndex,
     VMT_OT_MakeVMT,
+    VMT_OT_MakeAllVMT,
     VMT_PT_VMTPanel,
     VMT_PT_Paths,
+    VMT_UL_Images,
+    VMT_UL_Materials,
     VMT_PT_VMTSettings
 )
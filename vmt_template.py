@@ -0,0 +1,131 @@
+import os
+import re
+from functools import lru_cache
+
+# VMT templates, and the parameters for them read from a material's node tree.
+#
+# Templates are plain VMT text with two additions:
+#   {{name}}            replaced by the value of the parameter `name`
+#   {{?name}} at the start of a line
+#                       the rest of the line is only written if `name` has a value
+
+DEFAULT_VMT_TEMPLATE = '''\
+{{shader}}
+{
+	$basetexture "{{basetexture}}"
+{{?bumpmap}}	$bumpmap "{{bumpmap}}"
+{{?translucent}}	$translucent 1
+{{?alphatest}}	$alphatest 1
+{{?selfillum}}	$selfillum 1
+{{?selfillummask}}	$selfillummask "{{selfillummask}}"
+}
+'''
+
+_FIELD = re.compile(r'\{\{(\w+)\}\}')
+_CONDITION = re.compile(r'^\{\{\?(\w+)\}\}')
+
+
+class VMTTemplate:
+    def __init__(self, source):
+        # [(condition or None, [literal, field, literal, field, ..., literal])]
+        self.lines = []
+        for line in source.splitlines(keepends=True):
+            condition = None
+            m = _CONDITION.match(line)
+            if m:
+                condition = m.group(1)
+                line = line[m.end():]
+            self.lines.append((condition, _FIELD.split(line)))
+
+    def render(self, params):
+        out = []
+        for condition, parts in self.lines:
+            if condition is not None and not params.get(condition):
+                continue
+            for i, part in enumerate(parts):
+                out.append(str(params.get(part, '')) if i % 2 else part)
+        return ''.join(out)
+
+
+@lru_cache(maxsize=16)
+def compile_template(source):
+    """Parsed template for a source text, parsed once and reused"""
+    return VMTTemplate(source)
+
+
+# Node tree
+#################################################
+
+def linked_node(socket):
+    if socket is None or not socket.is_linked:
+        return None
+    return socket.links[0].from_node
+
+def find_image(socket, depth=8):
+    """The image of the first Image Texture node upstream of a socket"""
+    node = linked_node(socket)
+    while node is not None and depth > 0:
+        if node.type == 'TEX_IMAGE':
+            return node.image
+        # follow the first linked input (mix, color ramp, gamma...)
+        node = next((linked_node(s) for s in node.inputs if s.is_linked), None)
+        depth -= 1
+    return None
+
+def image_vtf_path(image, cdmaterials, file_stem):
+    """Game path of the VTF compiled from an image, without extension.
+    file_stem(image) is the name of the image's TGA/PSD without extension."""
+    return os.path.join(cdmaterials, file_stem(image))
+
+def surface_shader(mat):
+    if not mat.use_nodes or not mat.node_tree:
+        return None
+    for node in mat.node_tree.nodes:
+        if node.type == 'OUTPUT_MATERIAL' and node.is_active_output:
+            return linked_node(node.inputs.get('Surface'))
+    return None
+
+def uses_alpha_blend(mat):
+    # blend_method was replaced by surface_render_method in Blender 4.2
+    method = getattr(mat, 'surface_render_method', None)
+    if method is not None:
+        return method == 'BLENDED'
+    return getattr(mat, 'blend_method', 'OPAQUE') == 'BLEND'
+
+def material_params(mat, cdmaterials, file_stem):
+    """Template parameters for a material from its node tree, see image_vtf_path()"""
+    params = {
+        'shader': 'VertexLitGeneric',
+        'name': mat.name,
+        'basetexture': os.path.join(cdmaterials, mat.name),
+    }
+
+    shader = surface_shader(mat)
+    if shader is None or shader.type != 'BSDF_PRINCIPLED':
+        return params
+    inputs = shader.inputs
+
+    image = find_image(inputs.get('Base Color'))
+    if image:
+        params['basetexture'] = image_vtf_path(image, cdmaterials, file_stem)
+
+    normal_map = linked_node(inputs.get('Normal'))
+    if normal_map is not None and normal_map.type == 'NORMAL_MAP':
+        image = find_image(normal_map.inputs.get('Color'))
+        if image:
+            params['bumpmap'] = image_vtf_path(image, cdmaterials, file_stem)
+
+    alpha = inputs.get('Alpha')
+    if alpha is not None and (alpha.is_linked or alpha.default_value < 1):
+        params['translucent' if uses_alpha_blend(mat) else 'alphatest'] = 1
+
+    # 'Emission' became 'Emission Color' in Blender 4.0
+    emission = inputs.get('Emission Color') or inputs.get('Emission')
+    strength = inputs.get('Emission Strength')
+    if emission is not None and emission.is_linked and (strength is None or strength.is_linked or strength.default_value > 0):
+        params['selfillum'] = 1
+        image = find_image(emission)
+        if image and image_vtf_path(image, cdmaterials, file_stem) != params['basetexture']:
+            params['selfillummask'] = image_vtf_path(image, cdmaterials, file_stem)
+
+    return params
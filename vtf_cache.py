@@ -0,0 +1,125 @@
+import os
+import json
+import hashlib
+
+# Persistent record of VTF builds, stored next to the VTFs it describes.
+# A source is only recompiled when its content, its vtex settings file or the
+# vtex command line changed, or when the VTF is no longer on disk.
+
+MANIFEST_NAME = "vtf_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def vtf_output_path(out_dir, src_path):
+    return os.path.join(out_dir, os.path.splitext(os.path.basename(src_path))[0] + '.vtf')
+
+def vtf_is_valid(path):
+    """True if path is a VTF with a readable header and all of its image data,
+    e.g. not left empty by a crashed vtex"""
+    from .vtf import read_header
+    try:
+        read_header(path)
+    except (OSError, ValueError):
+        return False
+    return True
+
+def vtex_settings_path(src_path):
+    # vtex reads per-texture options from a .txt next to the source
+    return os.path.splitext(src_path)[0] + '.txt'
+
+
+class VTFManifest:
+    def __init__(self, out_dir):
+        self.path = os.path.join(out_dir, MANIFEST_NAME)
+        self.out_dir = out_dir
+        self.entries = {}
+        self.dirty = False
+
+        try:
+            with open(self.path, 'r', encoding='utf8') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.entries = data.get('entries', {})
+        except (OSError, ValueError):
+            pass
+
+    def _stat_source(self, path, entry):
+        """Returns (size, mtime_ns, digest) for a file, only hashing it if
+        its size or mtime differs from what the entry recorded."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        if entry and entry.get('size') == st.st_size and entry.get('mtime_ns') == st.st_mtime_ns:
+            return st.st_size, st.st_mtime_ns, entry['sha1']
+        return st.st_size, st.st_mtime_ns, file_digest(path)
+
+    def _fingerprint(self, src_path, args, entry=None):
+        src = self._stat_source(src_path, entry and entry.get('source'))
+        if src is None:
+            return None
+        settings_path = vtex_settings_path(src_path)
+        settings = self._stat_source(settings_path, entry and entry.get('settings'))
+
+        def pack(st):
+            return st and {'size': st[0], 'mtime_ns': st[1], 'sha1': st[2]}
+
+        return {
+            'source': pack(src),
+            'settings': pack(settings),
+            'args': list(args),
+        }
+
+    @staticmethod
+    def _same(a, b):
+        def key(st):
+            return st and st['sha1']
+        return (a['args'] == b['args']
+            and key(a['source']) == key(b['source'])
+            and key(a['settings']) == key(b['settings']))
+
+    def is_current(self, src_path, args):
+        """True if the VTF for src_path was built from the same inputs and its header is still valid"""
+        entry = self.entries.get(src_path)
+        if not entry or not vtf_is_valid(entry.get('vtf', '')):
+            return False
+
+        current = self._fingerprint(src_path, args, entry)
+        if current is None or not self._same(entry, current):
+            return False
+
+        # content is the same but the mtime moved (e.g. a re-save), remember the new stat
+        if current['source'] != entry['source'] or current['settings'] != entry['settings']:
+            entry.update(current)
+            self.dirty = True
+        return True
+
+    def record(self, src_path, args):
+        entry = self._fingerprint(src_path, args, self.entries.get(src_path))
+        if entry is None:
+            return
+        entry['vtf'] = vtf_output_path(self.out_dir, src_path)
+        self.entries[src_path] = entry
+        self.dirty = True
+
+    def forget(self, src_path):
+        if self.entries.pop(src_path, None) is not None:
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(self.out_dir, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'entries': self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self.dirty = False